@@ -0,0 +1,235 @@
+
+import requests, threading, socket, time
+from requests.auth import HTTPDigestAuth
+
+# Seconds between heartbeats we ask the camera to send on the event stream.
+HEARTBEAT     = 5
+# Reconnect delays, doubled after each failure up to the max.
+BACKOFF_MIN   = 1
+BACKOFF_MAX   = 60
+# Max bytes taken off the socket at a time.
+READ_SIZE     = 4096
+
+def parse_event(line):
+    """
+    Parse one event line, like:
+      Code=VideoMotion;action=Start;index=0
+    into a dict, returns None for anything else (boundaries, headers,
+    Heartbeat).
+    """
+    if not line.startswith('Code='):
+        return None
+    event = {}
+    for item in line.split(';'):
+        if '=' in item:
+            key, value = item.split('=',1)
+            event[key.strip()] = value.strip()
+    return event
+
+class EventParser():
+    """
+    Incremental parser for the multipart eventManager.cgi stream.  Data is
+    fed in as it arrives from the socket, complete lines are handled right
+    away and a partial line is kept until the rest shows up.
+    """
+
+    def __init__(self):
+        self.buffer     = b''
+        self.heartbeats = 0
+
+    def feed(self,data):
+        """
+        Returns the list of events completed by data.
+        """
+        events = []
+        self.buffer += data
+        if not b'\n' in self.buffer:
+            return events
+        lines = self.buffer.split(b'\n')
+        self.buffer = lines.pop()
+        for line in lines:
+            line = line.decode('utf-8','ignore').strip()
+            if line == 'Heartbeat':
+                self.heartbeats += 1
+                continue
+            event = parse_event(line)
+            if event is not None:
+                events.append(event)
+        return events
+
+class AmcrestEventStream():
+    """
+    Keeps an eventManager.cgi?action=attach subscription open to one Amcrest
+    camera in a thread, and calls callback(event) for each event as soon as
+    it arrives.  The camera sends a heartbeat so a dead connection is noticed
+    within a few heartbeats, and the stream is reconnected with backoff.
+    connect_callback(connected) is called when the stream connects or drops.
+    """
+
+    def __init__(self,host,port,user,password,callback,logger,codes=('VideoMotion',),heartbeat=HEARTBEAT,name=None,connect_callback=None):
+        self.host      = host
+        self.port      = port
+        self.callback  = callback
+        self.connect_callback = connect_callback
+        self.logger    = logger
+        self.codes     = codes
+        self.heartbeat = heartbeat
+        self.name      = host if name is None else name
+        self.auth      = HTTPDigestAuth(user,password)
+        self.url       = "http://{0}:{1}/cgi-bin/eventManager.cgi".format(host,port)
+        self.stop_event = threading.Event()
+        self.thread    = None
+        self.response  = None
+        self.connected = False
+        self.connects  = 0
+        self.events    = 0
+
+    def start(self):
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name='AmcrestEvents-{0}'.format(self.name))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        response = self.response
+        if response is not None:
+            # Unblocks the read in the stream thread.
+            response.close()
+
+    def run(self):
+        backoff = BACKOFF_MIN
+        while not self.stop_event.is_set():
+            try:
+                if self.listen():
+                    # Got data, so the camera was fine, start over on the delay.
+                    backoff = BACKOFF_MIN
+            except (requests.exceptions.RequestException, socket.error, ValueError) as err:
+                if not self.stop_event.is_set():
+                    self.logger.warning("AmcrestEventStream:%s: stream error: %s", self.name, err)
+            self.set_connected(False)
+            if self.stop_event.is_set():
+                break
+            self.logger.debug("AmcrestEventStream:%s: reconnecting in %s seconds", self.name, backoff)
+            self.stop_event.wait(backoff)
+            backoff = min(backoff * 2, BACKOFF_MAX)
+
+    def listen(self):
+        """
+        Open the stream and pass events on until it ends, returns True if
+        anything was read.
+        """
+        payload = {
+            'action':    'attach',
+            'codes':     '[{0}]'.format(','.join(self.codes)),
+            'heartbeat': self.heartbeat,
+        }
+        got_data = False
+        # Read timeout is a few heartbeats, so a silent camera is dropped.
+        with requests.get(self.url, params=payload, auth=self.auth, stream=True, timeout=(5, self.heartbeat * 3)) as response:
+            self.response = response
+            if response.status_code != 200:
+                self.logger.error("AmcrestEventStream:%s: attach failed with status %s", self.name, response.status_code)
+                return False
+            self.set_connected(True)
+            self.connects += 1
+            self.logger.info("AmcrestEventStream:%s: connected", self.name)
+            parser = EventParser()
+            for data in self.read_chunks(response):
+                got_data = True
+                for event in parser.feed(data):
+                    self.events += 1
+                    try:
+                        self.callback(event)
+                    except Exception as err:
+                        self.logger.error("AmcrestEventStream:%s: callback failed for %s: %s", self.name, event, err, exc_info=True)
+                if self.stop_event.is_set():
+                    break
+        self.response = None
+        return got_data
+
+    def set_connected(self,connected):
+        if self.connected == connected:
+            return
+        self.connected = connected
+        if self.connect_callback is not None:
+            try:
+                self.connect_callback(connected)
+            except Exception as err:
+                self.logger.error("AmcrestEventStream:%s: connect callback failed: %s", self.name, err, exc_info=True)
+
+    def read_chunks(self,response):
+        """
+        Yield data as soon as it arrives.  iter_content blocks until a whole
+        chunk_size is read when the camera doesn't use chunked encoding, so
+        read1 on the underlying http.client response is used when available.
+        """
+        fp = getattr(response.raw, '_fp', None)
+        if fp is not None and hasattr(fp, 'read1'):
+            while True:
+                data = fp.read1(READ_SIZE)
+                if not data:
+                    return
+                yield data
+        else:
+            for data in response.iter_content(chunk_size=1):
+                yield data
+
+    def stats(self):
+        return {
+            'connected': self.connected,
+            'connects':  self.connects,
+            'events':    self.events,
+        }
+
+if __name__ == '__main__':
+    #
+    # Runs a fake Amcrest event stream on localhost, subscribes to it and
+    # prints the latency from the fake camera sending each event until the
+    # callback gets it, then drops the connection to show the reconnect.
+    #   python3 AmcrestEvents.py [events]
+    #
+    import sys, logging
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+    logging.basicConfig(level=logging.INFO)
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    sent = {}
+    class FakeAmcrest(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Type', 'multipart/x-mixed-replace; boundary=myboundary')
+            self.end_headers()
+            def part(body):
+                body = body + '\r\n'
+                self.wfile.write("--myboundary\r\nContent-Type: text/plain\r\nContent-Length: {0}\r\n\r\n{1}\r\n".format(len(body),body).encode())
+                self.wfile.flush()
+            part('Heartbeat')
+            for i in range(count):
+                action = 'Start' if i % 2 == 0 else 'Stop'
+                sent[i] = time.perf_counter()
+                part('Code=VideoMotion;action={0};index={1}'.format(action,i))
+                time.sleep(0.01)
+            self.close_connection = True
+        def log_message(self, format, *args):
+            pass
+    class Server(ThreadingMixIn, HTTPServer):
+        daemon_threads = True
+    server = Server(('127.0.0.1', 0), FakeAmcrest)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    latencies = []
+    done = threading.Event()
+    def callback(event):
+        latencies.append(time.perf_counter() - sent[int(event['index'])])
+        if len(latencies) == count:
+            done.set()
+    stream = AmcrestEventStream('127.0.0.1', server.server_address[1], 'admin', 'pw', callback, logging.getLogger('AmcrestEvents'), heartbeat=1)
+    stream.start()
+    done.wait(10)
+    latencies.sort()
+    print("events={0} p50={1:.2f}ms max={2:.2f}ms".format(len(latencies), latencies[len(latencies) // 2] * 1000, latencies[-1] * 1000))
+    # The fake camera ends the stream after the events, wait for the reconnect.
+    time.sleep(BACKOFF_MIN + 0.5)
+    print("stats={0}".format(stream.stats()))
+    stream.stop()
@@ -0,0 +1,107 @@
+
+import threading
+from contextlib import contextmanager
+
+class DriverShadow():
+    """
+    Mixin for the polyinterface nodes that keeps a shadow of the driver
+    values last published to Polyglot/ISY.  setDriver only publishes values
+    that changed, reportDrivers only publishes drivers that were never
+    published or changed without being reported, and inside a driver_batch
+    each driver is published once with it's final value when the batch ends.
+    A batch only holds back updates made by the thread that started it.
+    Only the poll paths should rely on that, a query from ISY uses
+    reportDrivers(force=True) to send everything.
+    Must come before the polyinterface class in the bases.
+    """
+
+    def __init__(self,*args,**kwargs):
+        self.shadow_lock       = threading.RLock()
+        self.shadow_sent       = {}
+        # Batch depth and pending drivers of each thread.
+        self.shadow_local      = threading.local()
+        self.driver_updates    = 0
+        self.driver_suppressed = 0
+        super(DriverShadow, self).__init__(*args,**kwargs)
+
+    def setDriver(self, driver, value, report=True, force=False, uom=None):
+        if not report:
+            return super(DriverShadow, self).setDriver(driver, value, report, force, uom)
+        batch = self.shadow_batch()
+        with self.shadow_lock:
+            if batch.depth > 0 and not force:
+                if driver in batch.pending:
+                    # Overwritten before it was published.
+                    self.driver_suppressed += 1
+                batch.pending[driver] = (value,uom)
+                # Keep drivers current now, only the publish waits.
+                return super(DriverShadow, self).setDriver(driver, value, False, force, uom)
+            return self.publish_driver(driver, value, uom, force)
+
+    def publish_driver(self, driver, value, uom=None, force=False):
+        """
+        Send the driver if it differs from what was last published, must be
+        called with shadow_lock held.
+        """
+        state = str(value)
+        if not force and uom is None and self.shadow_sent.get(driver) == state:
+            self.driver_suppressed += 1
+            return True
+        self.driver_updates += 1
+        self.shadow_sent[driver] = state
+        return super(DriverShadow, self).setDriver(driver, value, True, force, uom)
+
+    def reportDrivers(self, force=False):
+        """
+        Publish drivers whose value was never published, or all of them
+        when force is True.
+        """
+        batch = self.shadow_batch()
+        with self.shadow_lock:
+            if force:
+                for d in self.drivers:
+                    self.shadow_sent[d['driver']] = str(d['value'])
+                self.driver_updates += len(self.drivers)
+                return super(DriverShadow, self).reportDrivers()
+            for d in self.drivers:
+                if d['driver'] in batch.pending:
+                    continue
+                if self.shadow_sent.get(d['driver']) == str(d['value']):
+                    self.driver_suppressed += 1
+                    continue
+                self.publish_driver(d['driver'], d['value'], force=True)
+
+    @contextmanager
+    def driver_batch(self):
+        """
+        Hold back driver updates until the outermost batch ends, then publish
+        each changed driver once.
+        """
+        batch = self.shadow_batch()
+        batch.depth += 1
+        try:
+            yield self
+        finally:
+            batch.depth -= 1
+            if batch.depth == 0:
+                pending = batch.pending
+                batch.pending = {}
+                with self.shadow_lock:
+                    for driver in pending:
+                        self.publish_driver(driver, pending[driver][0], pending[driver][1])
+
+    def shadow_batch(self):
+        """
+        The batch state of the calling thread.
+        """
+        batch = self.shadow_local
+        if not hasattr(batch,'depth'):
+            batch.depth   = 0
+            batch.pending = {}
+        return batch
+
+    def driver_stats(self):
+        return {
+            'updates':    self.driver_updates,
+            'suppressed': self.driver_suppressed,
+        }
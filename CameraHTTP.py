@@ -0,0 +1,257 @@
+
+import requests, threading, socket, time, ipaddress
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPDigestAuth,HTTPBasicAuth
+
+# How long to trust a resolved camera host name.
+DNS_TTL   = 300
+# Max keep-alive connections kept open to one camera.
+POOL_SIZE = 4
+# Seconds a camera read response is reused.
+CACHE_TTL = 2
+
+class SharedDigestAuth(HTTPDigestAuth):
+    """
+    HTTPDigestAuth keeps the server challenge per thread, so every poll and
+    cgi worker would get it's own 401 from each camera.  This shares the
+    challenge and nonce count between all the threads using the session, a
+    thread only gets a 401 when the camera drops the nonce.
+    """
+
+    def __init__(self,user,password):
+        super(SharedDigestAuth, self).__init__(user,password)
+        self.shared_lock  = threading.Lock()
+        self.shared_chal  = {}
+        self.shared_nonce = ''
+        self.shared_count = 0
+
+    def __call__(self,r):
+        self.init_per_thread_state()
+        with self.shared_lock:
+            if self.shared_nonce and not self._thread_local.last_nonce:
+                # First request on this thread, start from the shared challenge.
+                self._thread_local.chal        = self.shared_chal
+                self._thread_local.last_nonce  = self.shared_nonce
+                self._thread_local.nonce_count = self.shared_count
+        return super(SharedDigestAuth, self).__call__(r)
+
+    def build_digest_header(self,method,url):
+        with self.shared_lock:
+            tl = self._thread_local
+            # A challenge this thread just got from a 401 wins, otherwise
+            # use the shared one so the nonce count keeps going up.
+            fresh = tl.chal and tl.chal.get('nonce') not in (tl.last_nonce, self.shared_nonce)
+            if not fresh and self.shared_nonce:
+                tl.chal        = self.shared_chal
+                tl.last_nonce  = self.shared_nonce
+                tl.nonce_count = self.shared_count
+            header = super(SharedDigestAuth, self).build_digest_header(method,url)
+            self.shared_chal  = tl.chal
+            self.shared_nonce = tl.last_nonce
+            self.shared_count = tl.nonce_count
+            return header
+
+class CameraSession():
+    """
+    A persistent keep-alive session to one camera.  The auth object lives as
+    long as the session so Digest cameras reuse the server nonce, from any
+    thread, instead of paying a 401 challenge round trip on every request.
+    """
+
+    def __init__(self,host,port,user,password,auth_mode,logger):
+        self.host      = host
+        self.port      = port
+        self.user      = user
+        self.password  = password
+        self.auth_mode = auth_mode
+        self.logger    = logger
+        self.session   = requests.Session()
+        self.adapter   = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+        self.session.mount('http://', self.adapter)
+        if auth_mode == 1:
+            self.session.auth = SharedDigestAuth(user,password)
+        else:
+            self.session.auth = HTTPBasicAuth(user,password)
+        try:
+            ipaddress.ip_address(host)
+            self.is_ip = True
+        except ValueError:
+            self.is_ip = False
+        self.dns_ip     = None
+        self.dns_expire = 0
+        self.requests   = 0
+        self.errors     = 0
+
+    def resolve(self):
+        """
+        Return the address to connect to, host names are resolved once
+        and cached for DNS_TTL seconds.
+        """
+        if self.is_ip:
+            return self.host
+        if self.dns_ip is None or time.time() > self.dns_expire:
+            self.dns_ip     = socket.getaddrinfo(self.host, self.port, socket.AF_INET, socket.SOCK_STREAM)[0][4][0]
+            self.dns_expire = time.time() + DNS_TTL
+            self.logger.debug("CameraSession: resolved {0}={1}".format(self.host,self.dns_ip))
+        return self.dns_ip
+
+    def get(self,path,payload,timeout=5):
+        """
+        Send the request on the pooled connection, raises the same
+        exceptions as requests.get
+        """
+        self.requests += 1
+        try:
+            ip = self.resolve()
+        except socket.error as err:
+            self.errors += 1
+            raise requests.exceptions.ConnectionError("Unable to resolve {0}: {1}".format(self.host,err))
+        headers = None
+        if ip != self.host:
+            headers = {'Host': "{0}:{1}".format(self.host,self.port)}
+        try:
+            return self.session.get(
+                "http://{}:{}/{}".format(ip,self.port,path),
+                params=payload,
+                headers=headers,
+                timeout=timeout
+            )
+        except requests.exceptions.RequestException:
+            # Address may have changed, so resolve again next time.
+            self.errors += 1
+            self.dns_expire = 0
+            raise
+
+    def stats(self):
+        """
+        Return the request and urllib3 connection pool counters for this camera.
+        """
+        connections   = 0
+        pool_requests = 0
+        pools = self.adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools[key]
+            connections   += pool.num_connections
+            pool_requests += pool.num_requests
+        return {
+            'requests':    self.requests,
+            'errors':      self.errors,
+            'connections': connections,
+            'reused':      max(0, pool_requests - connections),
+        }
+
+    def close(self):
+        self.session.close()
+
+class CameraHTTP():
+    """
+    Keeps one CameraSession per camera so all CGI calls share keep-alive
+    connections.
+    """
+
+    def __init__(self,logger):
+        self.logger   = logger
+        self.sessions = {}
+        self.lock     = threading.Lock()
+
+    def get_session(self,host,port,user,password,auth_mode=0):
+        key = (host,str(port),user,auth_mode)
+        with self.lock:
+            session = self.sessions.get(key)
+            if session is None or session.password != password:
+                if session is not None:
+                    session.close()
+                self.logger.debug("CameraHTTP: New session for {0}:{1} auth_mode={2}".format(host,port,auth_mode))
+                session = CameraSession(host,port,user,password,auth_mode,self.logger)
+                self.sessions[key] = session
+        return session
+
+    def get(self,host,port,user,password,path,payload,auth_mode=0,timeout=5):
+        return self.get_session(host,port,user,password,auth_mode).get(path,payload,timeout=timeout)
+
+    def stats(self):
+        """
+        Return pool statistics for all cameras keyed by 'host:port'
+        """
+        with self.lock:
+            sessions = list(self.sessions.values())
+        return { "{0}:{1}".format(s.host,s.port): s.stats() for s in sessions }
+
+    def close(self):
+        with self.lock:
+            for key in self.sessions:
+                self.sessions[key].close()
+            self.sessions = {}
+
+class ResponseCache():
+    """
+    Short lived cache of camera read responses keyed on the camera, path
+    and params.  Identical requests that arrive while one is already on the
+    wire wait for it and share the answer instead of sending their own.
+    Any write to a camera invalidates everything cached for it.
+    """
+
+    def __init__(self,ttl=CACHE_TTL):
+        self.ttl       = ttl
+        self.lock      = threading.Lock()
+        self.entries   = {}
+        self.inflight  = {}
+        self.gens      = {}
+        self.hits      = 0
+        self.misses    = 0
+        self.coalesced = 0
+
+    def key(self,host,port,path,payload):
+        return (host,str(port),path,tuple(sorted((k,str(v)) for k,v in payload.items())))
+
+    def get(self,key,fetch):
+        """
+        Return the cached value for key, or call fetch to get it.  False
+        means the request failed and is never cached.
+        """
+        camera = key[0:2]
+        owner  = False
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > time.time():
+                self.hits += 1
+                return entry[1]
+            call = self.inflight.get(key)
+            if call is not None:
+                self.coalesced += 1
+            else:
+                self.misses += 1
+                call = { 'event': threading.Event(), 'value': False, 'gen': self.gens.get(camera,0) }
+                self.inflight[key] = call
+                owner = True
+        if not owner:
+            # Same request is already on the wire, wait for it's answer.
+            call['event'].wait()
+            return call['value']
+        value = False
+        try:
+            value = fetch()
+        finally:
+            with self.lock:
+                del self.inflight[key]
+                # Don't keep an answer if the camera was written while it was on the wire.
+                if value is not False and self.ttl > 0 and self.gens.get(camera,0) == call['gen']:
+                    self.entries[key] = (time.time() + self.ttl, value)
+            call['value'] = value
+            call['event'].set()
+        return value
+
+    def invalidate(self,host,port):
+        camera = (host,str(port))
+        with self.lock:
+            self.gens[camera] = self.gens.get(camera,0) + 1
+            for key in [key for key in self.entries if key[0:2] == camera]:
+                del self.entries[key]
+
+    def stats(self):
+        return {
+            'hits':      self.hits,
+            'misses':    self.misses,
+            'coalesced': self.coalesced,
+            'entries':   len(self.entries),
+        }
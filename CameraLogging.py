@@ -0,0 +1,130 @@
+
+import logging, queue, threading, time
+from logging.handlers import QueueHandler, QueueListener
+
+# Max records waiting to be written, more than this are dropped instead of
+# blocking the thread that logged them.
+LOG_QUEUE_SIZE = 10000
+# Seconds to hold back repeats of the same warning or error for a camera.
+LOG_RATE_LIMIT = 60
+# Leading record args that identify where a message came from.  The l_*
+# helpers put the node id, node name (or function) and the first message
+# arg there, which is the camera name or url.
+RATE_LIMIT_ARGS = 3
+
+def camera_log(logger, level, prefix, string, args, exc_info=False):
+    """
+    Log string with the prefix args that say where it came from, like
+    (id, name, function).  string is only formatted with args if the
+    record is emitted.  Without args it's escaped into the record msg
+    instead of passed as an arg, so RateLimitFilter keeps different
+    messages apart.
+    """
+    fmt = ":".join(["%s"] * len(prefix)) + ": "
+    if args:
+        logger.log(level, fmt + string, *(tuple(prefix) + tuple(args)), exc_info=exc_info)
+    else:
+        logger.log(level, fmt + str(string).replace('%','%%'), *prefix, exc_info=exc_info)
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets the first WARNING or above record for a message template and
+    camera through, then drops repeats of it for period seconds.  The next
+    one let through says how many were dropped.
+    """
+
+    def __init__(self,period=LOG_RATE_LIMIT):
+        super(RateLimitFilter, self).__init__()
+        self.period     = period
+        self.lock       = threading.Lock()
+        self.last       = {}
+        self.suppressed = 0
+
+    def filter(self,record):
+        if record.levelno < logging.WARNING or self.period <= 0:
+            return True
+        args = record.args if isinstance(record.args,tuple) else ()
+        key  = (record.msg,) + tuple(str(arg) for arg in args[0:RATE_LIMIT_ARGS])
+        now  = time.time()
+        with self.lock:
+            last = self.last.get(key)
+            if last is not None and now - last[0] < self.period:
+                self.last[key] = (last[0],last[1] + 1)
+                self.suppressed += 1
+                return False
+            if len(self.last) > 1000:
+                self.last = { k: v for k, v in self.last.items() if now - v[0] < self.period }
+            self.last[key] = (now,0)
+        if last is not None and last[1] > 0:
+            record.msg = "{0} ({1} repeats suppressed)".format(record.msg,last[1])
+        return True
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    QueueHandler that drops the record when the queue is full instead of
+    reporting an error.
+    """
+
+    def __init__(self,queue):
+        super(DroppingQueueHandler, self).__init__(queue)
+        self.dropped = 0
+
+    def enqueue(self,record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class CameraLogQueue():
+    """
+    Optional queued logging.  The handlers of each logger are moved behind
+    a QueueListener thread so poll, callback and command threads only put
+    the record on a queue and never wait on the log file.
+    """
+
+    def __init__(self,loggers,size=LOG_QUEUE_SIZE):
+        # The same logger twice would queue into a queue, so only keep the
+        # first of each, polyinterface.LOGGER can be the root logger.
+        self.loggers   = []
+        for logger in loggers:
+            if not any(logger is l for l in self.loggers):
+                self.loggers.append(logger)
+        self.size      = size
+        self.lock      = threading.Lock()
+        self.running   = []
+
+    def start(self):
+        with self.lock:
+            if self.running:
+                return
+            for logger in self.loggers:
+                handlers = list(logger.handlers)
+                if not handlers:
+                    continue
+                handler  = DroppingQueueHandler(queue.Queue(maxsize=self.size))
+                listener = QueueListener(handler.queue, *handlers, respect_handler_level=True)
+                for h in handlers:
+                    logger.removeHandler(h)
+                logger.addHandler(handler)
+                listener.start()
+                self.running.append((logger,handler,listener,handlers))
+
+    def stop(self):
+        """
+        Write out what is queued and put the original handlers back, in the
+        reverse of the order they were moved.
+        """
+        with self.lock:
+            for logger, handler, listener, handlers in reversed(self.running):
+                for h in handlers:
+                    logger.addHandler(h)
+                logger.removeHandler(handler)
+                listener.stop()
+            self.running = []
+
+    def stats(self):
+        with self.lock:
+            return {
+                'queued':  sum(handler.queue.qsize() for logger, handler, listener, handlers in self.running),
+                'dropped': sum(handler.dropped for logger, handler, listener, handlers in self.running),
+            }
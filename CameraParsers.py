@@ -0,0 +1,54 @@
+
+import re
+
+#
+# Parsers for the camera responses, kept apart from the nodes so they
+# only need the standard library.
+#
+
+# One flat <tag>value</tag> or <tag/> child of a CGI_Result
+CGI_TAG_RE = re.compile(r'<([^\s<>/]+)(?:/>|>([^<]*)</\1>)')
+
+def parse_cgi_result(data):
+    """
+    Fast scanner for the flat <CGI_Result><tag>value</tag>...</CGI_Result>
+    responses, returns the same tag:text dict ElementTree would give for the
+    children, or None when data is not that simple shape (entities, nesting,
+    comments, ...) so the caller can fall back to ElementTree.
+    """
+    body = data.strip()
+    if not body.startswith('<CGI_Result>') or not body.endswith('</CGI_Result>') or '&' in body:
+        return None
+    ret = {}
+    pos = 12
+    end = len(body) - 13
+    for match in CGI_TAG_RE.finditer(body, pos, end):
+        if body[pos:match.start()].strip():
+            return None
+        # ElementTree gives None for empty elements.
+        ret[match.group(1)] = match.group(2) or None
+        pos = match.end()
+    if body[pos:end].strip():
+        return None
+    return ret
+
+# One "var key='value';" line of a get_*.cgi response, quotes and the
+# trailing ; are optional, anything that doesn't look like that is skipped.
+VAR_RE = re.compile(r"^[ \t]*(?:var[ \t]+)?([^=\s;']+)[ \t]*=[ \t]*'?(.*?)'?[ \t]*;?[ \t\r]*$", re.M)
+
+def parse_vars(data,keys=None):
+    """
+    Parse the var key='value'; lines of a response into a dict in one
+    pass, lines that don't look like that are skipped.  If keys is passed
+    only those are returned.
+    """
+    ret  = {}
+    for match in VAR_RE.finditer(data):
+        key = match.group(1)
+        if keys is None:
+            ret[key] = match.group(2)
+        elif key in keys:
+            ret[key] = match.group(2)
+            if len(ret) == len(keys):
+                break
+    return ret
@@ -1,26 +1,123 @@
-
-import requests, threading, socketserver, re, socket
+import requests, threading, socketserver, re, socket, queue, time
+from http.server import HTTPServer, BaseHTTPRequestHandler
 from camera_funcs import get_network_ip
 from http.client import BadStatusLine  # Python 3.x
 
-class EchoRequestHandler(socketserver.BaseRequestHandler):
+# Max number of motion events waiting to be passed to the controller
+EVENT_QUEUE_SIZE = 256
+# Number of threads passing events to the controller
+EVENT_WORKERS    = 2
+# Same motion value for the same address within this many seconds is dropped
+MOTION_DEBOUNCE  = 2
+
+class MotionRequestHandler(BaseHTTPRequestHandler):
+    # Allows cameras to keep the connection open between callbacks
+    protocol_version = 'HTTP/1.1'
+    # Don't let a stuck camera hold a thread forever
+    timeout = 30
 
-    def handle(self):
+    def do_GET(self):
         try:
-            # Echo the back to the client
-            data = self.request.recv(1024)
-            # Don't worry about a status for now, just echo back.
-            self.request.sendall(data)
-            # Then parse it.
-            self.parent.handler(data.decode('utf-8','ignore'))
+            # Answer right away so the camera is never waiting on us.
+            if self.parent.match(self.path):
+                if self.parent.handler(self.path):
+                    self.send_reply(200)
+                else:
+                    # Event queue is full, tell the camera to try again.
+                    self.send_reply(503)
+            else:
+                self.send_reply(404)
+                self.parent.parent.logger.error("CameraRestServer:handler: Unrecognized request: %s %s", self.command, self.path)
         except (Exception) as err:
-            self.parent.parent.logger.error("request_handler failed {0}".format(err), exc_info=True)
-        return
+            self.parent.parent.logger.error("request_handler failed %s", err, exc_info=True)
+
+    def send_reply(self, code):
+        self.send_response(code)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        # Only formatted when debug is enabled.
+        self.parent.parent.logger.debug("CameraRestServer: %s " + format, self.address_string(), *args)
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    # Each camera connection gets it's own thread, and they don't block exit.
+    daemon_threads = True
+    request_queue_size = 128
+
+class MotionQueue():
+    """
+    Bounded queue between the callback threads and the controller.  Repeats
+    of the same motion value for an address inside the debounce window, or
+    while one is still queued, are collapsed so a burst of callbacks for one
+    event only reaches the controller once.
+    """
+
+    def __init__(self,parent,size=EVENT_QUEUE_SIZE,workers=EVENT_WORKERS,window=MOTION_DEBOUNCE):
+        self.parent    = parent
+        self.queue     = queue.Queue(maxsize=size)
+        self.workers   = workers
+        self.window    = window
+        self.lock      = threading.Lock()
+        self.last      = {}
+        self.pending   = set()
+        self.received  = 0
+        self.collapsed = 0
+        self.rejected  = 0
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self.worker, name='MotionQueue{0}'.format(i))
+            thread.daemon = True
+            thread.start()
+
+    def put(self,address,value):
+        """
+        Returns False when the queue is full so the caller can push back.
+        """
+        now = time.time()
+        with self.lock:
+            self.received += 1
+            key  = (address,value)
+            last = self.last.get(address)
+            if key in self.pending or (last is not None and last[0] == value and now - last[1] < self.window):
+                self.collapsed += 1
+                return True
+            try:
+                self.queue.put_nowait(key)
+            except queue.Full:
+                self.rejected += 1
+                return False
+            self.pending.add(key)
+            self.last[address] = (value,now)
+        return True
+
+    def worker(self):
+        while True:
+            key = self.queue.get()
+            with self.lock:
+                self.pending.discard(key)
+            try:
+                self.parent.motion(key[0],key[1])
+            except (Exception) as err:
+                self.parent.logger.error("MotionQueue: motion %s failed %s", key, err, exc_info=True)
+            self.queue.task_done()
+
+    def stats(self):
+        return {
+            'received':  self.received,
+            'collapsed': self.collapsed,
+            'rejected':  self.rejected,
+            'queued':    self.queue.qsize(),
+        }
 
 class CameraREST():
 
     def __init__(self,parent):
         self.parent  = parent
+        self.events  = MotionQueue(parent)
+        self.server  = None
 
     def start(self):
         self.myip    = self.get_network_ip()
@@ -28,14 +125,22 @@ class CameraREST():
             self.parent.logger.error('CameraREST: Unable to start since')
             return False
         self.address = (self.myip, 0) # let the kernel give us a port
-        self.parent.logger.debug("CameraREST: address={0}".format(self.address))
-        eh = EchoRequestHandler
-        eh.parent = self
-        self.server  = socketserver.TCPServer(self.address, eh)
-        self.parent.logger.info("CameraREST: Running on: %s:%s" % self.server.server_address)
+        self.parent.logger.debug("CameraREST: address=%s", self.address)
+        mh = MotionRequestHandler
+        mh.parent = self
+        self.server  = ThreadingHTTPServer(self.address, mh)
+        self.parent.logger.info("CameraREST: Running on: %s:%s", *self.server.server_address)
         self.thread  = threading.Thread(target=self.server.serve_forever)
-        #t.setDaemon(True) # don't hang on exit
+        self.thread.daemon = True # don't hang on exit
         self.thread.start()
+        self.events.start()
+
+    def stop(self):
+        if self.server is None:
+            return
+        self.server.shutdown()
+        self.server.server_close()
+        self.server = None
 
     def get_network_ip(self):
         """
@@ -43,11 +148,67 @@ class CameraREST():
         """
         return get_network_ip(self.parent.logger)
 
-    def handler(self, data):
-        self.parent.logger.debug("CameraRestServer:handler: Got {0}".format(data.strip()))
-        match = re.match( r'GET /motion/(.*) ', data, re.I)
+    def match(self, path):
+        return re.match( r'/motion/([^/?\s]+)', path, re.I)
+
+    def handler(self, path):
+        self.parent.logger.debug("CameraRestServer:handler: Got %s", path)
+        match = self.match(path)
         if match:
             address = match.group(1)
-            self.parent.motion(address,1)
-        else:
-            self.parent.logger.error("CameraRestServer:handler: Unrecognized socket server command: " + data)
+            return self.events.put(address,1)
+        self.parent.logger.error("CameraRestServer:handler: Unrecognized socket server command: %s", path)
+        return True
+
+if __name__ == '__main__':
+    #
+    # Load benchmark: Runs the server on localhost and fires motion callbacks
+    # at it from many keep-alive clients, then prints callbacks/sec and latency.
+    #   python3 CameraREST.py [clients] [callbacks_per_client]
+    #
+    import sys, logging, http.client
+    logging.basicConfig(level=logging.WARNING)
+    class BenchParent():
+        logger = logging.getLogger('CameraREST')
+        def __init__(self):
+            self.count = 0
+            self.lock  = threading.Lock()
+        def motion(self, address, value):
+            with self.lock:
+                self.count += 1
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    per_client = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    parent = BenchParent()
+    rest = CameraREST(parent)
+    rest.get_network_ip = lambda: '127.0.0.1'
+    rest.start()
+    host, port = rest.server.server_address
+    latencies = []
+    llock = threading.Lock()
+    def client(n):
+        conn = http.client.HTTPConnection(host, port, timeout=10)
+        mine = []
+        for i in range(per_client):
+            st = time.perf_counter()
+            conn.request('GET', '/motion/cam{0}m'.format(n))
+            resp = conn.getresponse()
+            resp.read()
+            mine.append(time.perf_counter() - st)
+        conn.close()
+        with llock:
+            latencies.extend(mine)
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+    st = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - st
+    latencies.sort()
+    total = len(latencies)
+    rest.events.queue.join()
+    print("clients={0} callbacks={1} handled={2} time={3:.2f}s rate={4:.0f}/s p50={5:.2f}ms p99={6:.2f}ms".format(
+        clients, total, parent.count, elapsed, total / elapsed,
+        latencies[total // 2] * 1000, latencies[int(total * 0.99) - 1] * 1000))
+    print("events={0}".format(rest.events.stats()))
+    rest.stop()
@@ -0,0 +1,82 @@
+
+import threading, queue, time, itertools
+
+# Max number of cameras being started at the same time.
+STARTUP_WORKERS = 8
+
+# Lower runs first, so every camera gets it's motion callback armed
+# before any camera gets a full query.
+PHASES = { 'arm': 0, 'query': 1 }
+
+class CameraStartup():
+    """
+    Runs the network part of node startup in a small pool of threads
+    instead of inside each node's start, which Polyglot calls one at a
+    time.  Work is done in phases, arming motion callbacks first, then full
+    queries, and a timeline is logged every time the pool catches up so
+    the time until all cameras are ready can be seen.
+    """
+
+    def __init__(self,logger,runner,workers=STARTUP_WORKERS,t0=None):
+        self.logger   = logger
+        # runner(node,func) runs func while holding the node's camera.
+        self.runner   = runner
+        self.workers  = workers
+        self.queue    = queue.PriorityQueue()
+        self.seq      = itertools.count()
+        self.lock     = threading.Lock()
+        self.t0       = time.time() if t0 is None else t0
+        self.active   = 0
+        self.timeline = { phase: {'done': 0, 'failed': 0, 'first': None, 'last': None} for phase in PHASES }
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self.worker, name='CameraStartup{0}'.format(i))
+            thread.daemon = True
+            thread.start()
+
+    def add(self,node):
+        """
+        Queue the startup work for node, arm_motion if it has one, then query.
+        """
+        with self.lock:
+            self.active += 1
+            if hasattr(node,'arm_motion'):
+                self.active += 1
+                self.queue.put((PHASES['arm'], next(self.seq), 'arm', node, node.arm_motion))
+            self.queue.put((PHASES['query'], next(self.seq), 'query', node, node.query))
+
+    def worker(self):
+        while True:
+            priority, seq, phase, node, func = self.queue.get()
+            st = time.time()
+            ok = True
+            try:
+                self.runner(node, func)
+            except Exception as err:
+                ok = False
+                self.logger.error("CameraStartup: %s %s failed: %s", node.address, phase, err, exc_info=True)
+            now = time.time()
+            self.logger.debug("CameraStartup: %s %s took %.2fs, at %.2fs", node.address, phase, now - st, now - self.t0)
+            with self.lock:
+                timeline = self.timeline[phase]
+                if ok:
+                    timeline['done'] += 1
+                else:
+                    timeline['failed'] += 1
+                if timeline['first'] is None:
+                    timeline['first'] = now - self.t0
+                timeline['last'] = now - self.t0
+                self.active -= 1
+                idle = self.active == 0
+            if idle:
+                self.logger.info("CameraStartup: caught up %s", self.stats())
+            self.queue.task_done()
+
+    def stats(self):
+        """
+        Counts and seconds since controller start of the first and last
+        finished task in each phase.
+        """
+        with self.lock:
+            return { phase: dict(self.timeline[phase]) for phase in self.timeline }
@@ -1,5 +1,10 @@
 
-import os,socket,struct,json,re,netifaces
+import os,socket,struct,json,re,netifaces,threading,time
+
+# Seconds to trust the cached network interface info
+NETWORK_CACHE_TTL = 300
+network_cache = { 'expire': 0, 'info': None }
+network_lock  = threading.Lock()
 
 def myint(value):
     """ round and convert to int """
@@ -21,20 +26,79 @@ def get_network_ip_old(remote_server="8.8.8.8",logger=None):
     logger.info('get_network_ip: Returning {0}'.format(rt))
     return rt
 
-def get_network_interface(interface='default',logger=None):
-    # Get the default gateway
+def load_network_info(logger=None):
+    """
+    Read the default gateway interface and the IPv4 addr, netmask and
+    broadcast of every interface from netifaces.
+    """
     gws = netifaces.gateways()
+    info = { 'default': None, 'interfaces': {} }
+    if 'default' in gws and netifaces.AF_INET in gws['default']:
+        info['default'] = gws['default'][netifaces.AF_INET][1]
+    for name in netifaces.interfaces():
+        addrs = []
+        for addr in netifaces.ifaddresses(name).get(netifaces.AF_INET,[]):
+            addrs.append({
+                'addr':      addr['addr'],
+                'netmask':   addr.get('netmask'),
+                'broadcast': addr.get('broadcast'),
+            })
+        if addrs:
+            info['interfaces'][name] = addrs
+    if logger is not None:
+        logger.debug("load_network_info: {}".format(info))
+    return info
+
+def get_network_info(logger=None,refresh=False):
+    """
+    Return the cached network info, see load_network_info.  It is reloaded
+    after NETWORK_CACHE_TTL seconds, or when refresh is True.
+    """
+    with network_lock:
+        if refresh or network_cache['info'] is None or time.time() > network_cache['expire']:
+            network_cache['info']   = load_network_info(logger=logger)
+            network_cache['expire'] = time.time() + NETWORK_CACHE_TTL
+        return network_cache['info']
+
+def invalidate_network_info():
+    """
+    Force the next get_network_info to reload, call this when the
+    network may have changed.
+    """
+    with network_lock:
+        network_cache['info'] = None
+
+def get_network_interface(interface='default',logger=None):
+    # Get the interface of the default gateway
+    info = get_network_info(logger=logger)
     rt = False
-    if interface in gws:
-        gwd = gws[interface][netifaces.AF_INET]
-        logger.debug("gwd: {}={}".format(interface,gwd))
-        ifad = netifaces.ifaddresses(gwd[1])
-        rt = ifad[netifaces.AF_INET]
-        logger.debug("ifad: {}={}".format(gwd[1],rt))
+    if interface == 'default':
+        interface = info['default']
+    if interface in info['interfaces']:
+        rt = info['interfaces'][interface]
+        logger.debug("ifad: {}={}".format(interface,rt))
     else:
-        logger.error("No {} in gateways:{}".format(interface,gateways))
+        logger.error("No {} in interfaces:{}".format(interface,info))
     return rt
 
+def get_network_interfaces(names=None,logger=None):
+    """
+    Return a list of the IPv4 interfaces that can broadcast, each a dict with
+    name, addr, netmask and broadcast.  If names is passed only those
+    interfaces are returned.
+    """
+    rt = []
+    info = get_network_info(logger=logger)
+    for name in info['interfaces']:
+        if names is not None and name not in names:
+            continue
+        for addr in info['interfaces'][name]:
+            if addr['broadcast'] is None or addr['addr'].startswith('127.'):
+                continue
+            rt.append(dict(addr, name=name))
+    if logger is not None:
+        logger.debug("get_network_interfaces: {}".format(rt))
+    return rt
 
 def get_network_ip(logger=None):
     try:
@@ -42,6 +106,7 @@ def get_network_ip(logger=None):
         rt = iface[0]['addr']
     except Exception as err:
         logger.error('get_network_ip: failed: {0}'.format(err))
+        invalidate_network_info()
         rt = False
     logger.info('get_network_ip: Returning {0}'.format(rt))
     return rt
@@ -52,6 +117,7 @@ def get_network_bcast(logger=None):
         rt = iface[0]['broadcast']
     except Exception as err:
         logger.error('get_network_bcast: failed: {0}'.format(err))
+        invalidate_network_info()
         rt = False
     logger.info('get_network_bcast: Returning {0}'.format(rt))
     return rt
@@ -134,6 +200,21 @@ def get_valid_node_name(name):
     # Remove <>`~!@#$%^&*(){}[]?/\;:"'` characters from name
     return re.sub(r"[<>`~!@#$%^&*(){}[\]?/\\;:\"']+", "", str_d(name))
 
+class MaskedPayload():
+    """
+    Wraps a request payload for logging, the password is only masked
+    when the log record is actually formatted.
+    """
+    def __init__(self,payload):
+        self.payload = payload
+
+    def __str__(self):
+        if 'pwd' in self.payload:
+            payload = dict(self.payload)
+            payload['pwd'] = '*'
+            return str(payload)
+        return str(self.payload)
+
 def get_server_data(logger):
     # Read the SERVER info from the json.
     try:
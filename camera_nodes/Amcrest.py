@@ -1,10 +1,18 @@
 
 import os
+import re
+import time
+import logging
+import threading
 import polyinterface
 from amcrest import AmcrestCamera
 from functools import partial
+from collections import namedtuple
 from camera_funcs import myint,myfloat,int2str,ip2long,long2ip,isBitI,setBit,clearBit,bool2int,str2int,str_d,get_valid_node_name
 from camera_nodes import Motion
+from CameraDrivers import DriverShadow
+from CameraLogging import camera_log
+from AmcrestEvents import AmcrestEventStream
 import xml.etree.ElementTree as ET
 
 LOGGER = polyinterface.LOGGER
@@ -17,40 +25,98 @@ LOGGER = polyinterface.LOGGER
 #bit3:Record
 linkage_bits = { "ring":0, "send_mail":1, "snap_picture":2, "record":3 }
 
-class Amcrest(polyinterface.Node):
-    def __init__(self, controller, user, password, config=None, node_data=None):
+# Seconds between attempts to reach a camera, doubled after each failure up to the max.
+CONNECT_RETRY_MIN = 5
+CONNECT_RETRY_MAX = 300
+
+def amcrest_key(config):
+    """
+    The key a camera's cached address and name are saved under.
+    """
+    return "{0}:{1}".format(config['host'],config.get('port',80))
+
+def amcrest_connect(host,port,user,password,logger,retry=True):
+    """
+    Connect to the camera and return (camera,address,name).  The address is
+    the last 14 characters of the serial number and the name is the machine
+    name.  Keeps trying with backoff when retry is True, otherwise returns
+    None on failure.  This blocks, so it's only called from background threads.
+    """
+    delay = CONNECT_RETRY_MIN
+    while True:
+        try:
+            logger.info("amcrest_connect: connecting to %s:%s", host, port)
+            camera  = AmcrestCamera(host, port, user, password).camera
+            address = get_valid_node_name(camera.serial_number.split()[0][-14:].lower())
+            name    = get_valid_node_name(camera.machine_name.split('=')[-1].rstrip())
+            logger.info("amcrest_connect: %s:%s is %s %s", host, port, address, name)
+            return camera, address, name
+        except Exception as err:
+            logger.error("amcrest_connect: %s:%s failed, retry in %s seconds: %s", host, port, delay, err)
+        if not retry:
+            return None
+        time.sleep(delay)
+        delay = min(delay * 2, CONNECT_RETRY_MAX)
+
+# One line of the MotionDetect config for the first channel, like:
+#   table.MotionDetect[0].EventHandler.RecordEnable=true
+MOTION_CONFIG_RE = re.compile(r'^table\.MotionDetect\[0\]\.([^=\s]+)=(.*?)\s*$', re.M)
+
+# Everything the node shows from the MotionDetect config.
+MotionConfig = namedtuple('MotionConfig', 'enable record_enable mail_enable snapshot_enable snapshot_times')
+
+def parse_motion_config(data):
+    """
+    Parse the configManager.cgi getConfig MotionDetect response into a
+    MotionConfig in one pass.
+    """
+    values = dict(MOTION_CONFIG_RE.findall(data))
+    return MotionConfig(
+        enable          = str2int(values.get('Enable','false')),
+        record_enable   = str2int(values.get('EventHandler.RecordEnable','false')),
+        mail_enable     = str2int(values.get('EventHandler.MailEnable','false')),
+        snapshot_enable = str2int(values.get('EventHandler.SnapshotEnable','false')),
+        snapshot_times  = myint(values.get('EventHandler.SnapshotTimes',0)),
+    )
+
+class Amcrest(DriverShadow, polyinterface.Node):
+    def __init__(self, controller, user, password, config=None, node_data=None, address=None, name=None, camera=None):
+        """
+        address and name come from the controllers cache or a finished
+        connect, camera is passed when the controller already connected.
+        Without it the camera is connected in the background by start.
+        """
         self.user = user
         self.password = password
         if node_data is None:
-            # Only config is passed in for a new node, so we need start to get some info.
+            # Only config is passed in for a new node.
             self.init      = True
-            self.update_config(user,password,config=config)
+            self.update_config(user,password,config=config,address=address,name=name,camera=camera)
         else:
             # Re-adding an existing node, which happens on restart.
             self.init      = False
             self.name      = node_data['name']
             self.address   = node_data['address']
         self.st  = False
+        self.events       = None
+        self.motion_state = 2
+        self.config       = None
+        self.seen_up      = False
         super(Amcrest, self).__init__(controller, self.address, self.address, self.name)
 
     # This is called by __init__ and the Controller during a discover
-    def update_config(self,user,password,config=None):
-        self.name      = "NewCamera"
+    def update_config(self,user,password,config=None,address=None,name=None,camera=None):
         self.host      = config['host']
         if 'port' in config:
             self.port = config['port']
         else:
             self.port = 80
-        # Need to connect to camera to get it's info.
-        self.l_info("init","connecting to {0}".format(self.host))
-        #
-        # TODO: What happens in error? try/catch?
-        self.camera    = AmcrestCamera(self.host, self.port, self.user, self.password).camera
-        self.l_info("init","got {0}".format(self.camera))
         # Node_Address is last 14 characters of the serial number
-        self.address = get_valid_node_name(self.camera.serial_number.split()[0][-14:].lower())
+        self.address   = address
         # Name is the machine name
-        self.name      = get_valid_node_name(self.camera.machine_name.split('=')[-1].rstrip())
+        self.name      = name
+        # None until the background connect is done.
+        self.camera    = camera
         #self.ip = get_network_ip(self.host)
         self.ip = "1.2.3.4"
         self.sys_ver      = 0
@@ -68,7 +134,7 @@ class Amcrest(polyinterface.Node):
             g_ip    = self.getDriver('GV2')
             g_port  = self.getDriver('GV3')
             g_authm = self.getDriver('GV10')
-            self.l_info("start","ip={0} port={1} auth_mode={2}".format(g_ip,g_port,g_authm))
+            self.l_info("start","ip=%s port=%s auth_mode=%s", g_ip, g_port, g_authm)
             if int(g_ip) == 0:
                 self.l_error("start","The IP address (GV2) was set to zero?  That's not good, you will need to run discover again")
             if int(g_port) == 0:
@@ -76,39 +142,50 @@ class Amcrest(polyinterface.Node):
             self.ip        = long2ip(int(g_ip))
             self.port      = g_port
             self.auth_mode = int(g_authm)
-            self.l_info("start","ip={0} port={1} auth_mode={2}".format(self.ip,self.port,self.auth_mode))
+            self.l_info("start","ip=%s port=%s auth_mode=%s", self.ip, self.port, self.auth_mode)
             # This will force query to get it
             self.sys_ver      = 0
             self.full_sys_ver = None
             # Make sure drivers are up to date.
             self.update_drivers()
+        self.load_capabilities()
         # Add my motion node now that the camera is defined.
         self.motion = self.controller.addNode(Motion(self.controller, self, self))
-        # Call query to pull in the params before adding the motion node.
-        self.query();
+        # Motion comes from the camera's event stream instead of polling.
+        self.events = AmcrestEventStream(self.host, self.port, self.user, self.password, self.event_callback, LOGGER, name=self.name, connect_callback=self.events_connected)
+        self.events.start()
+        if self.camera is None:
+            # Don't hold up the controller waiting for the camera.
+            thread = threading.Thread(target=self.connect, name='AmcrestConnect-{0}'.format(self.address))
+            thread.daemon = True
+            thread.start()
+        else:
+            # Query to pull in the params, along with the other cameras.
+            self.controller.start_camera(self)
+
+    def connect(self):
+        """
+        Runs in a thread to connect to a camera that was added from the
+        cached address and name, then queries it.
+        """
+        camera, address, name = amcrest_connect(self.host,self.port,self.user,self.password,LOGGER)
+        if address != self.address:
+            self.l_error("connect","%s:%s is now %s, but the node is %s", self.host, self.port, address, self.address)
+        self.camera = camera
+        self.controller.save_amcrest(amcrest_key({'host': self.host, 'port': self.port}), address, name)
+        self.controller.run_camera(self.address, self.query)
 
     def query(self):
         """ query the camera """
         # pylint: disable=unused-argument
         self.l_info("query","start")
-        self.get_status()
-        if self.st:
-            # Full System Version
-            self.full_sys_ver = str_d(self.camera.software_information[0].split('=')[1]);
-            sys_ver_l = self.full_sys_ver.split('.')
-            # Just the first part as a float
-            self.sys_ver      = myfloat("{0}.{1}".format(sys_ver_l[0],sys_ver_l[1]))
-            self.setDriver('GV1', self.sys_ver)
-            # Initialize network info
-            # Motion
-            self.setDriver('GV5', bool2int(self.camera.is_motion_detector_on()))
-            self.get_motion_params()
-            self.setDriver('GV6', self.record_enable)
-            self.setDriver('GV7', self.mail_enable)
-            self.setDriver('GV8', self.snapshot_enable)
-            self.setDriver('GV9', self.snapshot_times)
-            # All done.
-            self.reportDrivers()
+        # Uses the config from the last longPoll or write if there is one.
+        if self.get_config():
+            if not self.sys_ver:
+                self.get_sys_ver()
+            self.set_config_drivers()
+        # All done, send everything, even when it's not responding.
+        self.reportDrivers(force=True)
         self.l_info("query","done")
         return True
 
@@ -124,22 +201,39 @@ class Amcrest(polyinterface.Node):
     def longPoll(self):
         self.l_info("long_poll","start")
         # get_status handles properly setting self.connected and the driver
-        # so just call it.
-        self.get_status()
+        # and it fetches a new config, so update the drivers from that.
+        if self.get_status():
+            if not self.sys_ver:
+                self.get_sys_ver()
+            self.set_config_drivers()
         self.l_debug("long_poll","done")
         return
 
-    def l_info(self, name, string):
-        LOGGER.info("%s:%s:%s: %s" %  (self.id,self.name,name,string))
+    def runCmd(self, command):
+        """ Let the controller run the command, so it's drivers go out together """
+        return self.controller.run_cmd(self, command)
 
-    def l_error(self, name, string):
-        LOGGER.error("%s:%s:%s: %s" % (self.id,self.name,name,string))
+    def l_info(self, name, string, *args):
+        if LOGGER.isEnabledFor(logging.INFO):
+            self.l_log(logging.INFO, name, string, args)
 
-    def l_warning(self, name, string):
-        LOGGER.warning("%s:%s:%s: %s" % (self.id,self.name,name,string))
+    def l_error(self, name, string, *args, exc_info=False):
+        if LOGGER.isEnabledFor(logging.ERROR):
+            self.l_log(logging.ERROR, name, string, args, exc_info=exc_info)
 
-    def l_debug(self, name, string):
-        LOGGER.debug("%s:%s:%s: %s" % (self.id,self.name,name,string))
+    def l_warning(self, name, string, *args):
+        if LOGGER.isEnabledFor(logging.WARNING):
+            self.l_log(logging.WARNING, name, string, args)
+
+    def l_debug(self, name, string, *args):
+        if LOGGER.isEnabledFor(logging.DEBUG):
+            self.l_log(logging.DEBUG, name, string, args)
+
+    def l_log(self, level, name, string, args, exc_info=False):
+        """
+        string is only formatted with args if the record is emitted.
+        """
+        camera_log(LOGGER, level, (self.id, self.name, name), string, args, exc_info)
 
     # **********************************************************************
     #
@@ -163,18 +257,83 @@ class Amcrest(polyinterface.Node):
 
     def get_status(self):
         """
-        Simple check if the camera is responding.
+        Simple check if the camera is responding, which is fetching a new config.
         """
-        self.l_info("get_status","%s:%s" % (self.host,self.port))
-        # Get the led_mode since that is the simplest return status
-        rc = self.camera.machine_name
-        self.l_info("get_status","rc={0}".format(rc))
-        if rc == 0:
-            connected = False
-            self.l_error("get_status"," Failed to get_status: {0}".format(rc))
-        else:
-            connected = True
-        return self.set_st(connected)
+        self.l_info("get_status","%s:%s", self.host, self.port)
+        self.config = None
+        return self.get_config()
+
+    def get_config(self):
+        """
+        Return the MotionDetect config snapshot, it's fetched with one
+        getConfig call when there isn't one cached.  longPoll and writes
+        clear the cache.  Sets st since this is also the responding check.
+        """
+        if self.config is not None:
+            return self.config
+        if self.camera is None:
+            self.l_debug("get_config","Not connected yet")
+            self.set_st(False)
+            return None
+        try:
+            rc = self.camera.command('configManager.cgi?action=getConfig&name=MotionDetect')
+            data = str_d(rc.content.decode('utf-8','ignore'))
+        except Exception as err:
+            self.l_error("get_config","Failed to get config: %s", err)
+            self.set_st(False)
+            return None
+        if rc.status_code != 200:
+            self.l_error("get_config","Failed to get config: status=%s", rc.status_code)
+            self.set_st(False)
+            return None
+        self.config = parse_motion_config(data)
+        self.l_debug("get_config","%s", self.config)
+        if not self.st and self.seen_up:
+            # Back after being down, which is what a firmware upgrade looks
+            # like, so read the version again.
+            self.forget_capabilities()
+        self.seen_up = True
+        self.set_st(True)
+        return self.config
+
+    def get_sys_ver(self):
+        """
+        The version doesn't change without a reboot, so it's only fetched
+        when we don't know it, and saved so a restart doesn't need it either.
+        """
+        # Full System Version
+        self.set_sys_ver(str_d(self.camera.software_information[0].split('=')[1]))
+        self.controller.save_capabilities(self.address, {'sys': self.full_sys_ver})
+
+    def set_sys_ver(self,full_sys_ver):
+        self.full_sys_ver = full_sys_ver
+        sys_ver_l = self.full_sys_ver.split('.')
+        # Just the first part as a float
+        self.sys_ver      = myfloat("{0}.{1}".format(sys_ver_l[0],sys_ver_l[1]))
+        self.setDriver('GV1', self.sys_ver)
+
+    def load_capabilities(self):
+        """
+        Restore the version saved by the controller.
+        """
+        caps = self.controller.get_capabilities(self.address)
+        if caps is not None:
+            self.l_info("load_capabilities","%s", caps)
+            self.set_sys_ver(caps['sys'])
+
+    def forget_capabilities(self):
+        self.sys_ver = 0
+        self.controller.save_capabilities(self.address, None)
+
+    def set_config_drivers(self):
+        config = self.config
+        if config is None:
+            return
+        self.setDriver('GV5', config.enable)
+        self.setDriver('GV6', config.record_enable)
+        self.setDriver('GV7', config.mail_enable)
+        self.setDriver('GV8', config.snapshot_enable)
+        self.setDriver('GV9', config.snapshot_times)
 
     def get_motion_status(self):
         """
@@ -183,41 +342,55 @@ class Amcrest(polyinterface.Node):
         1 = On
         2 = Unknown
         """
-        self.l_error('get_motion_status','Not implemented yet')
+        if not self.tracks_motion():
+            return 2
+        return self.motion_state
         #self.get_status()
         #if not self.cam_status or not 'alarm_status' in self.cam_status:
         #    return 2
         #return int(self.cam_status['alarm_status'])
 
-    def get_motion_params(self):
-        self.l_info("get_motion_params","start")
-        self.mail_enable     = 0
-        self.record_enable   = 0
-        self.snapshot_enable = 0
-        self.snapshot_times  = 0
-        #
-        # Grab all motion detect params in one call
-        #
-        ret = self.camera.motion_detection
-        for s in ret.split():
-            if '=' in s:
-                a = s.split('=')
-                name  = a[0]
-                value = a[1]
-                if '.MailEnable' in name:
-                    self.l_info("get_motion_params","name='{0}' value={1}".format(name,value))
-                    self.mail_enable = str2int(value)
-                elif '.RecordEnable' in name:
-                    self.l_info("get_motion_params","name='{0}' value={1}".format(name,value))
-                    self.record_enable = str2int(value)
-                elif '.SnapshotEnable' in name:
-                    self.l_info("get_motion_params","name='{0}' value={1}".format(name,value))
-                    self.snapshot_enable = str2int(value)
-                elif '.SnapshotTimes' in name:
-                    self.l_info("get_motion_params","name='{0}' value={1}".format(name,value))
-                    self.snapshot_times = int(value)
-        self.l_info("get_motion_params","done")
-        return
+    def set_motion_status(self,value):
+        """
+        Called by motion node to set the current motion status.
+        """
+        self.motion_state = value
+
+    def tracks_motion(self):
+        """
+        Tells the motion node this camera keeps it's motion state up to
+        date itself, while the event stream is connected.
+        """
+        return self.events is not None and self.events.connected
+
+    def event_callback(self,event):
+        """
+        Called from the event stream thread for each camera event.
+        """
+        self.l_debug("event_callback","%s", event)
+        if event.get('Code') == 'VideoMotion':
+            if event.get('action') == 'Start':
+                self.motion_state = 1
+            elif event.get('action') == 'Stop':
+                self.motion_state = 0
+            else:
+                return
+            self.motion.set_motion_st(self.motion_state)
+
+    def events_connected(self,connected):
+        """
+        Called from the event stream thread when it connects or drops.  The
+        stream only sends changes, so assume no motion until it says
+        otherwise, and unknown while it's down.
+        """
+        self.l_info("events_connected","%s", connected)
+        self.motion_state = 0 if connected else 2
+        if hasattr(self,'motion'):
+            self.motion.set_motion_st(self.motion_state)
+
+    def stop_events(self):
+        if self.events is not None:
+            self.events.stop()
 
     # **********************************************************************
     #
@@ -227,21 +400,30 @@ class Amcrest(polyinterface.Node):
         """
         Video Motion Detect
         """
+        if self.camera is None:
+            self.l_error("set_vmd_enable","Not connected yet")
+            return False
         value = kwargs.get("value")
         if value is None:
-            self.l_error("set_vmd_enable","_set_vmd_enable not passed a value: %s" % (value))
+            self.l_error("set_vmd_enable","_set_vmd_enable not passed a value: %s", value)
             return False
         # TODO: Should use the _driver specified function instead of int.
-        self.l_info("set_vmd_enable","_set_vmd_enable %s" % (value))
+        self.l_info("set_vmd_enable","_set_vmd_enable %s", value)
         self.camera.motion_detection = int2str(value)
-        self.l_info("set_vmd_enable","is_motion_detector_on: {0}".format(self.camera.is_motion_detector_on()))
-        self.setDriver(driver, bool2int(self.camera.is_motion_detector_on()))
+        # Read back what the camera has now.
+        self.config = None
+        if self.get_config():
+            self.l_info("set_vmd_enable","is_motion_detector_on: %s", self.config.enable)
+            self.setDriver(driver, self.config.enable)
         return True
 
     def set_motion_param(self, driver=None, param=None, convert=None, **kwargs):
+        if self.camera is None:
+            self.l_error("set_motion_param","Not connected yet")
+            return False
         value = kwargs.get("value")
         if value is None:
-            self.l_error("set_motion_param","not passed a value: %s" % (value) )
+            self.l_error("set_motion_param","not passed a value: %s", value )
             return False
         if convert is not None:
             if convert == "int2str":
@@ -249,21 +431,23 @@ class Amcrest(polyinterface.Node):
             elif convert == "int":
                 sval = int(value)
             else:
-                self.l_info("set_motion_param","unknown convert={0}".format(convert))
+                self.l_info("set_motion_param","unknown convert=%s", convert)
         command = 'configManager.cgi?action=setConfig&MotionDetect[0].EventHandler.{0}={1}'.format(param,sval)
-        self.l_info("set_motion_param","comand={0}".format(command))
+        self.l_info("set_motion_param","comand=%s", command)
         rc = self.camera.command(command)
-        self.l_debug("set_motion_param","rc={0}".format(rc))
+        self.l_debug("set_motion_param","rc=%s", rc)
         # Used to check content here, but status_code seems better.
         if hasattr(rc,'status_code'):
             if rc.status_code == 200:
+                # Cached config is out of date now.
+                self.config = None
                 self.setDriver(driver, int(value))
                 return True
             else:
-                self.l_error("set_motion_param","command failed response_code={0}".format(rc.status_code))
+                self.l_error("set_motion_param","command failed response_code=%s", rc.status_code)
         else:
-            self.l_error("set_motion_param","command response object does not contain a status_code {0}".format(rc))
-        self.l_error("set_motion_param","failed to set {0}={1} return={2}".format(param,value,rc))
+            self.l_error("set_motion_param","command response object does not contain a status_code %s", rc)
+        self.l_error("set_motion_param","failed to set %s=%s return=%s", param, value, rc)
         return False
 
     def cmd_set_vmd_enable(self,command):
@@ -288,12 +472,15 @@ class Amcrest(polyinterface.Node):
 
     def cmd_goto_preset(self, command):
         """ Goto the specified preset. """
+        if self.camera is None:
+            self.l_error("cmd_goto_preset","Not connected yet")
+            return False
         value = command.get("value")
         if value is None:
             self.parent.send_error("_goto_preset not passed a value: %s" % (value) )
             return False
         rc = self.camera.go_to_preset(action='start', channel=0, preset_point_number=int(value))
-        self.l_info("_goto_preset","return={0}".format(rc))
+        self.l_info("_goto_preset","return=%s", rc)
         if "ok" in str_d(rc).lower():
             return True
         self.parent.send_error("_goto_preset failed to set {0} message={1}".format(int(value),rc))
@@ -1,18 +1,35 @@
 
 import polyinterface
-import os, json, logging, requests, threading,  re, socket, yaml
+import os, json, logging, requests, threading, time, re, socket, yaml
 from copy import deepcopy
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
 # SocketServer,
-from requests.auth import HTTPDigestAuth,HTTPBasicAuth
 from http.client import BadStatusLine  # Python 3.x
-from foscam_poll import foscam_poll
+from foscam_poll import foscam_scan
 from camera_nodes import *
-from camera_funcs import myint,long2ip,get_server_data,get_profile_info
-from CameraREST import CameraREST
+from camera_nodes.Motion import MOTION_TIMEOUT
+from camera_nodes.Amcrest import amcrest_connect,amcrest_key
+from camera_funcs import myint,long2ip,get_server_data,get_profile_info,invalidate_network_info,MaskedPayload
+from CameraREST import CameraREST,MOTION_DEBOUNCE
+from CameraHTTP import CameraHTTP,ResponseCache,CACHE_TTL
+from CameraDrivers import DriverShadow
+from CameraLogging import CameraLogQueue,RateLimitFilter,LOG_RATE_LIMIT,camera_log
+from CameraStartup import CameraStartup
 
 LOGGER = polyinterface.LOGGER
 
-class CameraController(polyinterface.Controller):
+# Default max number of cameras polled at the same time, can be
+# overridden with the poll_workers customParam.
+POLL_WORKERS = 8
+
+# Max number of camera CGI calls run at the same time by parallel()
+CGI_WORKERS = 16
+
+# Seconds between background Foscam discoveries for each Foscam Polling (GV4) setting
+FOSCAM_POLLING_INTERVALS = { 1: 10, 2: 20, 3: 30, 4: 60 }
+
+class CameraController(DriverShadow, polyinterface.Controller):
     """
     The Controller Class is the primary node from an ISY perspective. It is a Superclass
     of polyinterface.Node so all methods from polyinterface.Node are available to this
@@ -47,7 +64,11 @@ class CameraController(polyinterface.Controller):
         to override the __init__ method, but if you do, you MUST call super.
         """
         self.serverdata = get_server_data(LOGGER)
-        self.l_info('init','Initializing VERSION=%s' % (self.serverdata['version']))
+        self.l_info('init','Initializing VERSION=%s', self.serverdata['version'])
+        # Address keyed lookup of our nodes, kept in sync by addNode/delNode
+        self.node_index   = {}
+        # Camera address to it's Motion node
+        self.motion_index = {}
         super(CameraController, self).__init__(polyglot)
         self.name = 'Camera Controller'
         self.address = 'cameractrl'
@@ -64,17 +85,30 @@ class CameraController(polyinterface.Controller):
         version does nothing.
         """
         self.l_info('start',"...")
+        self.start_time      = time.time()
         # TODO; This is only necessary when drivers change?
         #self.addNode(self,update=True)
         self.discover_thread = None
+        self.discover_event  = threading.Event()
+        self.discovered      = {}
+        self.poll_executor  = None
+        self.cgi_executor   = None
+        self.startup        = None
+        self.poll_locks     = {}
+        self.custom_data_lock = threading.RLock()
         self.num_cams       = self.getDriver('GV3')
         self.foscam_polling = self.getDriver('GV4')
         self.debug_mode     = self.getDriver('GV5')
         self.hb             = 0
+        # Queued logging is off until load_params says otherwise.
+        self.log_queue_mode = 'false'
+        self.log_queue      = CameraLogQueue([LOGGER, logging.getLogger()])
+        self.log_filter     = RateLimitFilter()
+        LOGGER.addFilter(self.log_filter)
 
         # Short Poll
         val = self.getDriver('GV6')
-        self.l_debug("start","shortPoll={0} GV6={1}".format(self.polyConfig['shortPoll'],val))
+        self.l_debug("start","shortPoll=%s GV6=%s", self.polyConfig['shortPoll'], val)
         if val is None or int(val) == 0:
             val = self.polyConfig['shortPoll']
             self.setDriver('GV6',val)
@@ -84,7 +118,7 @@ class CameraController(polyinterface.Controller):
 
         # Long Poll
         val = self.getDriver('GV7')
-        self.l_debug("start","longPoll={0} GV7={1}".format(self.polyConfig['longPoll'],val))
+        self.l_debug("start","longPoll=%s GV7=%s", self.polyConfig['longPoll'], val)
         if val is None or int(val) == 0:
             val = self.polyConfig['longPoll']
             self.setDriver('GV7',val)
@@ -93,13 +127,24 @@ class CameraController(polyinterface.Controller):
         self.long_poll = val
 
         self.logger = LOGGER
+        self.http   = CameraHTTP(LOGGER)
+        self.cache  = ResponseCache()
         self.rest_server = CameraREST(self)
         self.rest_server.start()
 
         self.check_profile()
         self.query();
         self.load_params()
+        self.log_filter.period = self.log_rate_limit
+        self.set_log_queue()
+        self.rest_server.events.window = self.motion_debounce
+        self.cache.ttl = self.cache_ttl
+        self.poll_executor = ThreadPoolExecutor(max_workers=self.poll_workers)
+        self.cgi_executor  = ThreadPoolExecutor(max_workers=CGI_WORKERS)
+        self.startup = CameraStartup(LOGGER,self.startup_run,workers=self.poll_workers,t0=self.start_time)
+        self.startup.start()
         self.add_all_cams()
+        self.start_discover_thread()
 
     def shortPoll(self):
         """
@@ -108,15 +153,7 @@ class CameraController(polyinterface.Controller):
         or longPoll. No need to Super this method the parent version does nothing.
         The timer can be overriden in the server.json.
         """
-        if self.discover_thread is not None:
-            if self.discover_thread.isAlive():
-                self.l_debug('shortPoll','discover thread still running...')
-            else:
-                self.l_debug('shortPoll','discover thread is done...')
-                self.discover_thread = None
-        for node in self.nodes:
-            if self.nodes[node].address != self.address:
-                self.nodes[node].shortPoll()
+        self.poll_nodes('shortPoll')
 
     def longPoll(self):
         """
@@ -126,7 +163,115 @@ class CameraController(polyinterface.Controller):
         The timer can be overriden in the server.json.
         """
         self.heartbeat()
-        pass
+        self.poll_nodes('longPoll')
+        self.l_debug('longPoll','http stats=%s', self.http.stats())
+        self.l_debug('longPoll','motion event stats=%s', self.rest_server.events.stats())
+        self.l_debug('longPoll','response cache stats=%s', self.cache.stats())
+        self.l_debug('longPoll','driver stats=%s', self.get_driver_stats())
+        self.l_debug('longPoll','log queue stats=%s suppressed=%s', self.log_queue.stats(), self.log_filter.suppressed)
+
+    def poll_nodes(self, poll):
+        """
+        Run the poll method ('shortPoll' or 'longPoll') of all camera nodes
+        in the poll pool.  Nodes are grouped by their primary so a camera
+        and it's motion node are always polled in order by the same worker,
+        and a camera still busy from the previous cycle is skipped.
+        """
+        if self.poll_executor is None:
+            self.l_debug('poll_nodes','Not started yet, skipping %s', poll)
+            return
+        groups = {}
+        for address in list(self.nodes):
+            node = self.nodes[address]
+            if node.address != self.address:
+                groups.setdefault(node.primary, []).append(node)
+        for primary in groups:
+            lock = self.get_poll_lock(primary)
+            if not lock.acquire(blocking=False):
+                self.l_warning('poll_nodes','%s is still running a previous poll, skipping %s', primary, poll)
+                continue
+            self.poll_executor.submit(self.poll_group_locked, lock, groups[primary], poll)
+
+    def poll_group_locked(self, lock, nodes, poll):
+        """
+        Called in the poll pool to poll one camera and it's children.
+        """
+        try:
+            self.poll_group(nodes, poll)
+        finally:
+            lock.release()
+
+    def poll_group(self, nodes, poll):
+        for node in nodes:
+            try:
+                # Each changed driver goes out once at the end of the poll.
+                with node.driver_batch():
+                    getattr(node,poll)()
+            except Exception as err:
+                self.l_error('poll_group','%s %s failed: %s', node.address, poll, err, exc_info=True)
+
+    def parallel(self, funcs):
+        """
+        Run independent camera calls at the same time in the cgi pool,
+        returns their results in the same order.  This is a separate pool
+        from the polls so a poll waiting here can never starve it.
+        """
+        if self.cgi_executor is None:
+            return [func() for func in funcs]
+        futures = [self.cgi_executor.submit(func) for func in funcs]
+        return [future.result() for future in futures]
+
+    def run_cmd(self, node, command):
+        """
+        Called by the camera nodes runCmd so the drivers changed by an ISY
+        command go out together when it's done.
+        """
+        return self.node_cmd(node, command)
+
+    def run_camera(self, primary, func, *args):
+        """
+        Run func for the camera with this address from a timer thread.  It
+        waits for a poll of the same camera to finish instead of skipping.
+        """
+        with self.get_poll_lock(primary):
+            try:
+                func(*args)
+            except Exception as err:
+                self.l_error('run_camera','%s %s failed: %s', primary, getattr(func,'__name__',func), err, exc_info=True)
+
+    def start_camera(self, node):
+        """
+        Called by the camera and motion node start, the camera work is done
+        in the startup pool so Polyglot can go on to start the next node.
+        """
+        if self.startup is None:
+            if hasattr(node,'arm_motion'):
+                self.startup_run(node, node.arm_motion)
+            return self.startup_run(node, node.query)
+        self.startup.add(node)
+
+    def startup_run(self, node, func):
+        """
+        Run one startup step for node holding it's camera, and wait for it.
+        """
+        with self.get_poll_lock(node.primary):
+            return self.node_batch(node, func)
+
+    def node_batch(self, node, func):
+        with node.driver_batch():
+            return func()
+
+    def node_cmd(self, node, command):
+        with node.driver_batch():
+            return polyinterface.Node.runCmd(node, command)
+
+    def get_poll_lock(self, primary):
+        """
+        Return the lock that serializes access to the camera with this address.
+        """
+        # setdefault is atomic, so threads racing on a new camera all get
+        # the same lock.
+        return self.poll_locks.setdefault(primary, threading.Lock())
 
     def query(self):
         """
@@ -143,10 +288,22 @@ class CameraController(polyinterface.Controller):
         self.set_short_poll(self.short_poll)
         self.set_long_poll(self.long_poll)
         for node in self.nodes:
-            self.nodes[node].reportDrivers()
+            self.nodes[node].reportDrivers(force=True)
+
+    def get_driver_stats(self):
+        """
+        Return the driver updates published and suppressed for all nodes.
+        """
+        stats = self.driver_stats()
+        for node in list(self.nodes.values()):
+            if node is not self:
+                nstats = node.driver_stats()
+                stats['updates']    += nstats['updates']
+                stats['suppressed'] += nstats['suppressed']
+        return stats
 
     def heartbeat(self):
-        self.l_debug('heartbeat','hb={}'.format(self.hb))
+        self.l_debug('heartbeat','hb=%s', self.hb)
         if self.hb == 0:
             self.reportCmd("DON",2)
             self.hb = 1
@@ -163,11 +320,36 @@ class CameraController(polyinterface.Controller):
         if self.load_params():
             self.l_info("discover","Refuse to continue since load_params failed")
         if self.foscam_polling > 0:
-            self.discover_foscam()
+            # A manual discover may be because the network changed.
+            invalidate_network_info()
+            # The discover thread does the work so ISY is not blocked by the scan.
+            self.discover_event.set()
         else:
-            self.l_info("discover","Not Polling for Foscam MJPEG cameras %s" % (self.foscam_polling))
+            self.l_info("discover","Not Polling for Foscam MJPEG cameras %s", self.foscam_polling)
             self.set_num_cams(self.num_cams)
-        self.l_info('discover',"Done adding cameras")
+
+    def start_discover_thread(self):
+        self.discover_thread = threading.Thread(target=self.discover_loop, name='discover')
+        self.discover_thread.daemon = True
+        self.discover_thread.start()
+
+    def discover_loop(self):
+        """
+        Runs Foscam discovery in the background at the Foscam Polling interval,
+        or right away when woken up by DISCOVER or a polling setting change.
+        """
+        while True:
+            # None waits until woken up when polling is off.
+            interval = FOSCAM_POLLING_INTERVALS.get(self.foscam_polling)
+            self.discover_event.wait(interval)
+            self.discover_event.clear()
+            if self.foscam_polling == 0:
+                continue
+            try:
+                self.discover_foscam()
+            except Exception as err:
+                self.l_error('discover_loop','discover failed: %s', err, exc_info=True)
+            self.l_info('discover_loop',"Done adding cameras")
 
     def delete(self):
         """
@@ -178,13 +360,35 @@ class CameraController(polyinterface.Controller):
         """
         self.l_info('delete','Oh God I\'m being deleted. Nooooooooooooooooooooooooooooooooooooooooo.')
 
+    def addNode(self, node, update=False):
+        node = super(CameraController, self).addNode(node, update)
+        self.node_index[node.address] = node
+        if node.id == 'CamMotion':
+            self.motion_index[node.primary] = node
+        return node
+
+    def delNode(self, address):
+        node = self.node_index.pop(address, None)
+        if node is not None and hasattr(node,'stop_events'):
+            node.stop_events()
+        if node is not None and node.id == 'CamMotion' and self.motion_index.get(node.primary) is node:
+            del self.motion_index[node.primary]
+        # Only cameras have a poll lock, it's keyed by their address.
+        self.poll_locks.pop(address, None)
+        return super(CameraController, self).delNode(address)
+
     def get_node(self,address):
-        self.l_info('get_node',"adress={0}".format(address))
-        for node in self.nodes:
-            #self.l_debug('get_node',"node={0}".format(node))
-            if self.nodes[node].address == address:
-                return self.nodes[node]
-        return None
+        return self.node_index.get(address)
+
+    def get_motion_node(self,address):
+        """
+        Motion callbacks may use the motion node address, "<addr>m",
+        or the address of it's camera.
+        """
+        node = self.motion_index.get(address)
+        if node is None:
+            node = self.node_index.get(address)
+        return node
 
     def load_params(self):
         """
@@ -210,6 +414,60 @@ class CameraController(polyinterface.Controller):
             self.password = default_password
             st = False
 
+        # Max number of cameras to poll at the same time.
+        self.poll_workers = POLL_WORKERS
+        if 'poll_workers' in self.polyConfig['customParams']:
+            try:
+                self.poll_workers = max(1,int(self.polyConfig['customParams']['poll_workers']))
+            except ValueError:
+                self.l_error('load_params',"poll_workers=%s is not a number, using %s", self.polyConfig['customParams']['poll_workers'], POLL_WORKERS)
+
+        # Seconds to ignore repeated motion callbacks from the same camera
+        self.motion_debounce = MOTION_DEBOUNCE
+        if 'motion_debounce' in self.polyConfig['customParams']:
+            try:
+                self.motion_debounce = float(self.polyConfig['customParams']['motion_debounce'])
+            except ValueError:
+                self.l_error('load_params',"motion_debounce=%s is not a number, using %s", self.polyConfig['customParams']['motion_debounce'], MOTION_DEBOUNCE)
+
+        # Seconds motion stays on after the last callback, 0 polls the camera instead.
+        self.motion_timeout = MOTION_TIMEOUT
+        if 'motion_timeout' in self.polyConfig['customParams']:
+            try:
+                self.motion_timeout = float(self.polyConfig['customParams']['motion_timeout'])
+            except ValueError:
+                self.l_error('load_params',"motion_timeout=%s is not a number, using %s", self.polyConfig['customParams']['motion_timeout'], MOTION_TIMEOUT)
+
+        # Seconds to reuse camera read responses, 0 turns off caching.
+        self.cache_ttl = CACHE_TTL
+        if 'cache_ttl' in self.polyConfig['customParams']:
+            try:
+                self.cache_ttl = float(self.polyConfig['customParams']['cache_ttl'])
+            except ValueError:
+                self.l_error('load_params',"cache_ttl=%s is not a number, using %s", self.polyConfig['customParams']['cache_ttl'], CACHE_TTL)
+
+        # Network interfaces to search for Foscam cameras, default is all of them.
+        self.discover_interfaces = None
+        if 'discover_interfaces' in self.polyConfig['customParams']:
+            self.discover_interfaces = [name.strip() for name in self.polyConfig['customParams']['discover_interfaces'].split(',') if name.strip() != '']
+
+        # Write logs from a background thread, true, false (default) or debug
+        # to only do it while the debug mode is Debug.
+        self.log_queue_mode = 'false'
+        if 'log_queue' in self.polyConfig['customParams']:
+            self.log_queue_mode = self.polyConfig['customParams']['log_queue'].lower()
+            if self.log_queue_mode not in ('true','false','debug'):
+                self.l_error('load_params',"Unknown log_queue=%s, must be true, false or debug, using false", self.log_queue_mode)
+                self.log_queue_mode = 'false'
+
+        # Seconds to hold back repeated warnings and errors for a camera, 0 turns it off.
+        self.log_rate_limit = LOG_RATE_LIMIT
+        if 'log_rate_limit' in self.polyConfig['customParams']:
+            try:
+                self.log_rate_limit = float(self.polyConfig['customParams']['log_rate_limit'])
+            except ValueError:
+                self.l_error('load_params',"log_rate_limit=%s is not a number, using %s", self.polyConfig['customParams']['log_rate_limit'], LOG_RATE_LIMIT)
+
         # Make sure they are in the params
         self.addCustomParam({'password': self.password, 'user': self.user, 'cam_example': '{ "type": "Amcrest", "host": "host_or_IP", "port": "port_number" }'})
 
@@ -228,22 +486,22 @@ class CameraController(polyinterface.Controller):
         """
         for address in self._nodes:
             node = self._nodes[address]
-            self.l_info("add_existing_cams","node={0} = {1}".format(address,node))
+            self.l_info("add_existing_cams","node=%s = %s", address, node)
             if node['address'] == self.address:
                 # Ignore myself
                 pass
             elif node['node_def_id'] == "FoscamMJPEG":
-                self.l_info("add_existing_cams","Adding FoscamMJPEG camera: %s" % (node['name']))
+                self.l_info("add_existing_cams","Adding FoscamMJPEG camera: %s", node['name'])
                 self.addNode(FoscamMJPEG(self, self.user, self.password, node_data=node))
                 self.incr_num_cams()
             elif node['node_def_id'] == "FoscamHD2":
-                self.l_info("add_existing_cams","Adding FoscamHD2 camera: {0} = {1}".format(node['name'],node))
+                self.l_info("add_existing_cams","Adding FoscamHD2 camera: %s = %s", node['name'], node)
                 self.addNode(FoscamHD2(self, self.user, self.password, node_data=node))
                 self.incr_num_cams()
             elif node['node_def_id'] == 'CamMotion':
                 pass
             else:
-                self.l_error("add_existing_cams","Unknown camera id %s for %s" % (node['node_def_id'],node['name']))
+                self.l_error("add_existing_cams","Unknown camera id %s for %s", node['node_def_id'], node['name'])
 
     def add_config_cams(self):
         """
@@ -255,7 +513,7 @@ class CameraController(polyinterface.Controller):
             if match is not None and match.group(1) != "example":
                 # The hub address can be everything following the cam_
                 address = match.group(1)
-                self.l_info('add_config_cams','got param {0} {1}'.format(param,address))
+                self.l_info('add_config_cams','got param %s %s', param, address)
                 # Get the customParam value which is json code
                 #  { "type":"Amcrest", "host": "192.168.1.86", "port": "80" }
                 cfg = self.polyConfig['customParams'][param]
@@ -263,114 +521,218 @@ class CameraController(polyinterface.Controller):
                     cfgd = json.loads(cfg)
                 except:
                     err = sys.exc_info()[0]
-                    self.l_error('add_config_cams','failed to parse cfg={0} Error: {1}'.format(cfg,err))
+                    self.l_error('add_config_cams','failed to parse cfg=%s Error: %s', cfg, err)
                 # Check host and type are defined.
                 addit = True
                 if not 'host' in cfgd:
-                    self.l_error('add_config_cams','No host in customParam {0} value={1}'.format(param,cfg))
+                    self.l_error('add_config_cams','No host in customParam %s value=%s', param, cfg)
                     addit = False
                 if not 'type' in cfgd:
-                    self.l_error('add_config_cams','No type in customParam {0} value={1}'.format(param,cfg))
+                    self.l_error('add_config_cams','No type in customParam %s value=%s', param, cfg)
                     addit = False
                 if addit:
                     if cfgd['type'] == "Amcrest":
-                        self.addNode(Amcrest(self, self.user, self.password, config=cfgd))
+                        self.add_amcrest(cfgd)
                     self.incr_num_cams()
 
+    def add_amcrest(self, cfgd):
+        """
+        Add the node right away when the camera's address and name are
+        cached, it connects in the background.  Otherwise the address comes
+        from the camera's serial number, so connect in a thread and add it
+        when that's done.
+        """
+        cache = self.polyConfig['customData'].get('amcrest',{}).get(amcrest_key(cfgd))
+        if cache is not None:
+            self.addNode(Amcrest(self, self.user, self.password, config=cfgd, address=cache['address'], name=cache['name']))
+            return
+        thread = threading.Thread(target=self.connect_amcrest, args=(cfgd,), name='AmcrestConnect-{0}'.format(cfgd['host']))
+        thread.daemon = True
+        thread.start()
+
+    def connect_amcrest(self, cfgd):
+        camera, address, name = amcrest_connect(cfgd['host'],cfgd.get('port',80),self.user,self.password,LOGGER)
+        self.save_amcrest(amcrest_key(cfgd), address, name)
+        self.addNode(Amcrest(self, self.user, self.password, config=cfgd, address=address, name=name, camera=camera))
+
+    def save_amcrest(self, key, address, name):
+        """
+        Remember the address and name of the Amcrest camera at key (host:port)
+        so it can be added without waiting on the camera next time.
+        """
+        with self.custom_data_lock:
+            cameras = self.polyConfig['customData'].get('amcrest',{})
+            if cameras.get(key) == {'address': address, 'name': name}:
+                return
+            cameras = dict(cameras)
+            cameras[key] = {'address': address, 'name': name}
+            self.save_custom_data('amcrest', cameras)
+
+    def get_capabilities(self, address):
+        """
+        Return the static info saved for the camera with this address, or None.
+        """
+        return self.polyConfig['customData'].get('capabilities',{}).get(address)
+
+    def save_capabilities(self, address, caps):
+        """
+        Remember the static info (model, amba, firmware, auth mode, sys
+        version) of the camera with this address so it isn't fetched again,
+        or forget it when caps is None.
+        """
+        with self.custom_data_lock:
+            cameras = self.polyConfig['customData'].get('capabilities',{})
+            if cameras.get(address) == caps:
+                return
+            cameras = dict(cameras)
+            if caps is None:
+                cameras.pop(address,None)
+            else:
+                cameras[address] = caps
+            self.save_custom_data('capabilities', cameras)
+
+    def save_custom_data(self, key, value):
+        """
+        Save one top level key of customData, keeping the rest.
+        """
+        with self.custom_data_lock:
+            cdata = deepcopy(self.polyConfig['customData'])
+            cdata[key] = value
+            self.polyConfig['customData'] = cdata
+            self.saveCustomData(cdata)
+
     def discover_foscam(self):
-        self.l_info("discover_foscam","Polling for Foscam cameras %s" % (self.foscam_polling))
-        cams = foscam_poll(LOGGER)
-        self.l_debug("discover_foscam","Camera Data: " + str(cams))
-        for cam in cams:
+        self.l_info("discover_foscam","Polling for Foscam cameras %s", self.foscam_polling)
+        # Stop looking as soon as all the cameras we know about have answered.
+        expected = [node.address for node in list(self.node_index.values()) if node.id == 'FoscamMJPEG' or node.id == 'FoscamHD2']
+        # Add each camera as it answers, instead of waiting for the scan to finish.
+        for cam in foscam_scan(LOGGER,expected=expected,interfaces=self.discover_interfaces):
+            self.l_debug("discover_foscam","Camera Data: %s", cam)
             cam['id'] = cam['id'].lower()
-            self.l_info("discover_foscam","Checking to add camera: id=%s name=%s" % (cam['id'], cam['name']))
+            self.l_info("discover_foscam","Checking to add camera: id=%s name=%s", cam['id'], cam['name'])
             for key, value in cam.items():
                 if key != 'name' and key != 'id':
-                    self.l_debug('discover_foscam','  {}={}'.format(key,value))
+                    self.l_debug('discover_foscam','  %s=%s', key, value)
             lnode = self.get_node(cam['id'])
             if lnode:
-                self.l_info("discover_foscam","Already exists, updating %s %s" % (cam['id'], cam['name']))
-                lnode.update_config(self.user, self.password, udp_data=cam)
-                lnode.update_drivers()
+                if self.discover_changed(lnode,cam):
+                    self.l_info("discover_foscam","Already exists, updating %s %s", cam['id'], cam['name'])
+                    # Not while the camera is being polled or started.
+                    self.run_camera(lnode.address, self.update_camera, lnode, cam)
+                else:
+                    self.l_debug("discover_foscam","Already exists, no change %s %s", cam['id'], cam['name'])
             else:
                 if cam['mtype'] == "MJPEG":
-                    self.l_info("discover_foscam","Adding FoscamMJPEG camera: %s" % (cam['name']))
+                    self.l_info("discover_foscam","Adding FoscamMJPEG camera: %s", cam['name'])
                     self.addNode(FoscamMJPEG(self, self.user, self.password, udp_data=cam))
                     self.incr_num_cams()
 
                 elif cam['mtype'] == "HD2":
-                    self.l_info("discover_foscam","Adding FoscamHD camera: %s" % (cam['name']))
+                    self.l_info("discover_foscam","Adding FoscamHD camera: %s", cam['name'])
                     self.addNode(FoscamHD2(self, self.user, self.password, udp_data=cam))
                     self.incr_num_cams()
 
                 else:
-                    self.l_error("discover_foscam","Unknown type %s for Foscam Camera %s" % (cam['type'],cam['name']))
-            self.l_info("discover_foscam","Done")
+                    self.l_error("discover_foscam","Unknown type %s for Foscam Camera %s", cam['type'], cam['name'])
+            self.discovered[cam['id']] = (cam['ip'],str(cam['port']),cam['sys'])
+        self.l_info("discover_foscam","Done")
+
+    def update_camera(self,node,cam):
+        """
+        Update an existing camera with what discovery found, called holding
+        it's poll lock.
+        """
+        node.update_config(self.user, self.password, udp_data=cam)
+        node.update_drivers()
+
+    def discover_changed(self,node,cam):
+        """
+        True if the discovered ip, port or sys version is different from
+        what we last saw, or from what the node has on the first discover.
+        """
+        new = (cam['ip'],str(cam['port']),cam['sys'])
+        if cam['id'] in self.discovered:
+            return self.discovered[cam['id']] != new
+        # FoscamHD2 keeps the discovered sys version apart from full_sys_ver.
+        sys_ver = getattr(node,'disc_sys_ver',None) or getattr(node,'full_sys_ver',None)
+        return (getattr(node,'ip',None),str(getattr(node,'port',None)),sys_ver) != new
 
     def on_exit(self, **kwargs):
-        self.server.socket.close()
+        # No more motion callbacks or events coming in.
+        self.rest_server.stop()
+        for node in list(self.node_index.values()):
+            if hasattr(node,'stop_events'):
+                node.stop_events()
+        # Don't wait on polls that are stuck on a camera.
+        for executor in (self.poll_executor, self.cgi_executor):
+            if executor is not None:
+                executor.shutdown(wait=False)
+        self.http.close()
+        self.log_queue.stop()
         return True
 
     def motion(self,address,value):
         """ Poll Camera's  """
-        self.l_info("motion","%s '%s'" % (address, value) )
-        lnode = self.get_node(address)
+        self.l_info("motion","%s '%s'", address, value )
+        lnode = self.get_motion_node(address)
         if lnode:
             return lnode.motion(value)
         else:
-            self.l_error("motion","No node for motion on address %s" % (address));
+            self.l_error("motion","No node for motion on address %s", address);
         return False
 
-    def http_get(self,ip,port,user,password,path,payload,auth_mode=0):
-        url = "http://{}:{}/{}".format(ip,port,path)
+    def http_get(self,ip,port,user,password,path,payload,auth_mode=0,cache=False):
+        """
+        Send a request to a camera.  Read only requests should pass cache=True
+        so they can be answered from the response cache, or share a matching
+        request already on the wire.  Anything else is treated as a write which
+        clears what is cached for the camera.
+        """
+        if cache:
+            key = self.cache.key(ip,port,path,payload)
+            return self.cache.get(key, partial(self.http_get_direct,ip,port,user,password,path,payload,auth_mode=auth_mode))
+        try:
+            return self.http_get_direct(ip,port,user,password,path,payload,auth_mode=auth_mode)
+        finally:
+            self.cache.invalidate(ip,port)
 
-        if 'pwd' in payload:
-            payload_mask = deepcopy(payload)
-            payload_mask['pwd'] = '*'
-        else:
-            payload_mask = payload
-        self.l_debug("http_get","Sending: %s %s auth_mode=%d" % (url, payload_mask, auth_mode) )
-        if auth_mode == 0:
-            auth = HTTPBasicAuth(user,password)
-        elif auth_mode == 1:
-            auth = HTTPDigestAuth(user,password)
-        else:
-            self.l_error('http_get',"Unknown auth_mode '%s' for request '%s'.  Must be 0 for 'digest' or 1 for 'basic'." % (auth_mode, url) )
+    def http_get_direct(self,ip,port,user,password,path,payload,auth_mode=0):
+        url = "http://{}:{}/{}".format(ip,port,path)
+        # The password is only masked if the record is emitted.
+        self.l_debug("http_get","Sending: %s %s auth_mode=%s", url, MaskedPayload(payload), auth_mode )
+        if auth_mode != 0 and auth_mode != 1:
+            self.l_error('http_get',"Unknown auth_mode '%s' for request '%s'.  Must be 0 for 'digest' or 1 for 'basic'.", auth_mode, url )
             return False
 
         try:
-            response = requests.get(
-                url,
-                auth=auth,
-                params=payload,
-                timeout=5
-            )
+            # Goes through the pooled keep-alive session for this camera
+            response = self.http.get(ip,port,user,password,path,payload,auth_mode=auth_mode,timeout=5)
         # This is supposed to catch all request excpetions.
         except requests.exceptions.RequestException as e:
-            self.l_error('http_get',"Connection error for %s: %s" % (url, e))
+            self.l_error('http_get',"Connection error for %s: %s", url, e)
             return False
-        self.l_debug('http_get',' Got: code=%s' % (response.status_code))
+        self.l_debug('http_get',' Got: code=%s', response.status_code)
         #self.l_debug('http_get','      text=%s' % (response.text))
         if response.status_code == 200:
             #self.l_debug('http_get',"http_get: Got: text=%s" % response.text)
             return response.text
         elif response.status_code == 400:
-            self.l_error('http_get',"Bad request: %s" % (url) )
+            self.l_error('http_get',"Bad request: %s", url )
         elif response.status_code == 404:
-            self.l_error('http_get',"Not Found: %s" % (url) )
+            self.l_error('http_get',"Not Found: %s", url )
         elif response.status_code == 401:
             # Authentication error
             self.l_error('http_get',
                 "Failed to authenticate, please check your username and password")
         else:
-            self.l_error('http_get',"Unknown response %s: %s" % (response.status_code, url) )
+            self.l_error('http_get',"Unknown response %s: %s", response.status_code, url )
         return False
 
     def check_profile(self):
         self.profile_info = get_profile_info(LOGGER)
         # Set Default profile version if not Found
         cdata = deepcopy(self.polyConfig['customData'])
-        self.l_info('check_profile','profile_info={0} customData={1}'.format(self.profile_info,cdata))
+        self.l_info('check_profile','profile_info=%s customData=%s', self.profile_info, cdata)
         if not 'profile_info' in cdata:
             cdata['profile_info'] = { 'version': 0 }
         if self.profile_info['version'] == cdata['profile_info']['version']:
@@ -378,21 +740,30 @@ class CameraController(polyinterface.Controller):
         else:
             self.update_profile = True
             self.poly.installprofile()
-        self.l_info('check_profile','update_profile={}'.format(self.update_profile))
-        cdata['profile_info'] = self.profile_info
-        self.saveCustomData(cdata)
+        self.l_info('check_profile','update_profile=%s', self.update_profile)
+        self.save_custom_data('profile_info', self.profile_info)
+
+    def l_info(self, name, string, *args):
+        if LOGGER.isEnabledFor(logging.INFO):
+            self.l_log(logging.INFO, name, string, args)
 
-    def l_info(self, name, string):
-        LOGGER.info("%s:%s: %s" %  (self.id,name,string))
+    def l_error(self, name, string, *args, exc_info=False):
+        if LOGGER.isEnabledFor(logging.ERROR):
+            self.l_log(logging.ERROR, name, string, args, exc_info=exc_info)
 
-    def l_error(self, name, string, exc_info=False):
-        LOGGER.error("%s:%s: %s" % (self.id,name,string), exc_info=exc_info)
+    def l_warning(self, name, string, *args):
+        if LOGGER.isEnabledFor(logging.WARNING):
+            self.l_log(logging.WARNING, name, string, args)
 
-    def l_warning(self, name, string):
-        LOGGER.warning("%s:%s: %s" % (self.id,name,string))
+    def l_debug(self, name, string, *args):
+        if LOGGER.isEnabledFor(logging.DEBUG):
+            self.l_log(logging.DEBUG, name, string, args)
 
-    def l_debug(self, name, string):
-        LOGGER.debug("%s:%s: %s" % (self.id,name,string))
+    def l_log(self, level, name, string, args, exc_info=False):
+        """
+        string is only formatted with args if the record is emitted.
+        """
+        camera_log(LOGGER, level, (self.id, name), string, args, exc_info)
 
     def set_num_cams(self,val):
         if val is None:
@@ -406,8 +777,13 @@ class CameraController(polyinterface.Controller):
     def set_foscam_polling(self,val):
         if val is None:
             val = 0
+        old = self.foscam_polling
         self.foscam_polling = int(val)
         self.setDriver('GV4', self.foscam_polling)
+        if old is None or int(old) != self.foscam_polling:
+            # Let the discover thread pick up the new interval, a query
+            # that doesn't change it shouldn't start a scan.
+            self.discover_event.set()
 
     def set_debug_mode(self,level):
         if level is None:
@@ -427,12 +803,22 @@ class CameraController(polyinterface.Controller):
         elif level == 50:
             self.set_all_logs(logging.CRITICAL)
         else:
-            self.l_error("set_debug_mode","Unknown level {0}".format(level))
+            self.l_error("set_debug_mode","Unknown level %s", level)
 
     def set_all_logs(self,level):
         LOGGER.setLevel(level)
         logging.getLogger('requests').setLevel(level)
         logging.getLogger('urllib3').setLevel(level)
+        self.set_log_queue()
+
+    def set_log_queue(self):
+        """
+        Start or stop queued logging for the log_queue param and current level.
+        """
+        if self.log_queue_mode == 'true' or (self.log_queue_mode == 'debug' and LOGGER.isEnabledFor(logging.DEBUG)):
+            self.log_queue.start()
+        else:
+            self.log_queue.stop()
 
     def set_short_poll(self,val):
         if val is None:
@@ -1,9 +1,14 @@
 
 import os
+import logging
+import threading
 import polyinterface
 from functools import partial
 from camera_funcs import myint,myfloat,ip2long,long2ip,isBitI,setBit,clearBit
 from camera_nodes import Motion
+from CameraDrivers import DriverShadow
+from CameraLogging import camera_log
+from CameraParsers import parse_cgi_result
 import xml.etree.ElementTree as ET
 
 LOGGER = polyinterface.LOGGER
@@ -34,7 +39,12 @@ IS_AMBA = {
     "FI9928P"    : True,
 }
 
-class FoscamHD2(polyinterface.Node):
+# Short polls between getDevState motion checks while idle, and while an
+# alarm is active.
+MOTION_POLL_IDLE   = 3
+MOTION_POLL_ACTIVE = 1
+
+class FoscamHD2(DriverShadow, polyinterface.Node):
     def __init__(self, controller, user, password, udp_data=None, node_data=None):
         self.user = user
         self.password = password
@@ -50,11 +60,14 @@ class FoscamHD2(polyinterface.Node):
             self.init      = False
             self.name      = node_data['name']
             self.address   = node_data['address']
+            self.disc_sys_ver = None
         else:
             self.l_error("__init__","one of node_data or udp_data must be passed in")
             return False
         self.amba = False
+        self.caps = None
         self.cam_status = {}
+        self.status_lock = threading.Lock()
         self.st  = False
         self.set_motion_params_st = True
         super(FoscamHD2, self).__init__(controller, self.address, self.address, self.name)
@@ -64,7 +77,19 @@ class FoscamHD2(polyinterface.Node):
         self.name      = udp_data['name']
         self.ip        = udp_data['ip']
         self.port      = udp_data['port']
+        # The sys version discovery reports, check_dev_info may replace
+        # full_sys_ver with the hardwareVer from the camera.
+        self.disc_sys_ver = str(udp_data['sys'])
         self.parse_sys_ver(udp_data['sys'])
+        if getattr(self,'caps',None) is None:
+            return
+        if self.caps['sys'] is None:
+            # Fetched before the camera was discovered, so save it's version now.
+            self.save_capabilities()
+        elif self.caps['sys'] != self.disc_sys_ver:
+            # New firmware may change what the camera is, so fetch it again.
+            self.l_info("update_config","sys version changed %s -> %s", self.caps['sys'], self.disc_sys_ver)
+            self.forget_capabilities()
 
     def update_drivers(self):
         self.setDriver('GV2',  ip2long(self.ip))
@@ -78,24 +103,26 @@ class FoscamHD2(polyinterface.Node):
             # It's an existing Node, so get the info we need from it.
             g_ip    = self.getDriver('GV2')
             g_port  = self.getDriver('GV3')
-            self.l_info("start","ip={0} port={1} auth_mode={2}".format(g_ip,g_port,self.auth_mode))
+            self.l_info("start","ip=%s port=%s auth_mode=%s", g_ip, g_port, self.auth_mode)
             if int(g_ip) == 0:
                 self.l_error("start","The IP address (GV2) was set to zero?  That's not good, you will need to run discover again")
             if int(g_port) == 0:
                 self.l_error("start","The port (GV3) was set to zero?  That's not good, you will need to run discover again")
             self.ip        = long2ip(int(g_ip))
             self.port      = g_port
-            self.l_info("start","ip={0} port={1} auth_mode={2}".format(self.ip,self.port,self.auth_mode))
+            self.l_info("start","ip=%s port=%s auth_mode=%s", self.ip, self.port, self.auth_mode)
             # This will force query to get it
             self.sys_s_ver    = 0
             self.sys_e_ver    = 0
             self.full_sys_ver = None
             # Make sure drivers are up to date.
             self.update_drivers()
+        self.load_capabilities()
+        self.motion_countdown = MOTION_POLL_IDLE
         # Add my motion node now that the camera is defined.
         self.motion = self.controller.addNode(Motion(self.controller, self, self))
-        # Call query to pull in the params before adding the motion node.
-        self.query();
+        # Query to pull in the params, along with the other cameras.
+        self.controller.start_camera(self)
 
     def query(self):
         """
@@ -106,20 +133,35 @@ class FoscamHD2(polyinterface.Node):
         self.l_info("query","start")
         # Get current camera params.
         self.get_cam_all()
-        self.reportDrivers()
+        self.reportDrivers(force=True)
         self.l_info("query","done")
         return True
 
     def shortPoll(self):
-        """ Nothing to poll?  """
+        """ Check motion, fast while an alarm is active and slow when idle """
         #response = os.system("ping -c 1 -w2 " + self.ip + " > /dev/null 2>&1")
         # Fix the motion params if it failed the last time.
         if not self.set_motion_params_st and self.st:
             self.set_motion_params()
+        if self.st and hasattr(self,'motion'):
+            self.motion_countdown -= 1
+            if self.motion_countdown <= 0:
+                self.motion.set_motion_st(self.get_motion_status())
+                self.set_motion_countdown()
         return True
 
+    def set_motion_countdown(self):
+        if self.motion.motion_st == 1:
+            self.motion_countdown = MOTION_POLL_ACTIVE
+        else:
+            self.motion_countdown = MOTION_POLL_IDLE
+
     def longPoll(self):
         self.l_info("long_poll","..")
+        if self.st and self.caps is None:
+            # Don't know what the camera is yet, or it was upgraded.
+            self.get_cam_all()
+            return
         # get_status handles properly setting self.st and the driver
         # so just call it.
         self.get_status()
@@ -130,11 +172,29 @@ class FoscamHD2(polyinterface.Node):
         0 = Off
         1 = On
         2 = Unknown
+        One getDevState feeds both this and the IR LED state.
         """
-        self.get_status()
-        if not self.cam_status or not 'alarm_status' in self.cam_status:
+        rc = self.get_cam_dev_state(report=True)
+        return self.get_devstate_motion(rc)
+
+    def get_devstate_motion(self,rc=0):
+        """
+        Motion status from getDevState motionDetectAlarm, which is
+        0 = Disabled, 1 = No Alarm, 2 = Alarm Detected
+        """
+        if rc != 0 or not 'motionDetectAlarm' in self.cam_status.get('devstate',{}):
             return 2
-        return int(self.cam_status['alarm_status'])
+        if int(self.cam_status['devstate']['motionDetectAlarm']) == 2:
+            return 1
+        return 0
+
+    def tracks_motion(self):
+        """
+        Tells the motion node this camera keeps it's motion state up to
+        date itself, by polling getDevState, which it only does while it's
+        responding.  Otherwise the motion node checks, and goes unknown.
+        """
+        return bool(self.st)
 
     def set_motion_status(self,value):
         """
@@ -159,40 +219,20 @@ class FoscamHD2(polyinterface.Node):
         self.full_sys_ver = str(sys_ver)
         vnums = self.full_sys_ver.split(".")
         if len(vnums) == 4:
-            self.l_debug("parse_sys_ver","{0} 0={1} 1={2} 2={3} 3={4}".format(sys_ver,vnums[0],vnums[1],vnums[2],vnums[3]))
+            self.l_debug("parse_sys_ver","%s 0=%s 1=%s 2=%s 3=%s", sys_ver, vnums[0], vnums[1], vnums[2], vnums[3])
             self.sys_s_ver = myfloat("%d.%d" % (int(vnums[0]),int(vnums[1])),2)
             self.sys_e_ver = myfloat("%d.%d" % (int(vnums[2]),int(vnums[3])),2)
-            self.l_debug("parse_sys_ver","sys_s_ver={} sys_e_ver".format(self.sys_s_ver,self.sys_e_ver))
+            self.l_debug("parse_sys_ver","sys_s_ver=%s sys_e_ver=%s", self.sys_s_ver, self.sys_e_ver)
         else:
             self.l_waning("parse_sys_ver","Unknown sys_Ver{}".format(sys_ver))
             self.sys_s_ver = None
             self.sys_e_ver = None
 
-
-    def get_motion_status(self):
-        """
-        Called by motion node to return the current motion status.
-        0 = Off
-        1 = On
-        2 = Unknown
-        """
-        return 0
-        self.get_status()
-        if not self.cam_status or not 'alarm_status' in self.cam_status:
-            return 2
-        return int(self.cam_status['alarm_status'])
-
-    def set_motion_status(self,value):
-        """
-        Called by motion node to set the current motion status.
-        """
-        self.cam_status['alarm_status'] = value
-
     # **********************************************************************
     #
     # Camera Access Routines
     #
-    def http_get(self, cmd, payload = {}):
+    def http_get(self, cmd, payload = {}, cache=False):
         """ Call http_get on this camera for the specified path and payload """
         # Doesn't accept a payload, so convert to arg
         # and neither basic or digest authmode works!?!? Must pass with command
@@ -200,43 +240,48 @@ class FoscamHD2(polyinterface.Node):
         #for key in payload:
         #    path += "&%s=%s" % (key,payload[key])
         path = "cgi-bin/CGIProxy.fcgi"
+        # Copy so concurrent calls never share the default or callers dict
+        payload = dict(payload)
         payload['cmd'] = cmd
         payload['usr'] = self.user
         payload['pwd'] = self.password
-        return self.parent.http_get(self.ip,self.port,self.user,self.password,path,payload,auth_mode=self.auth_mode)
+        return self.parent.http_get(self.ip,self.port,self.user,self.password,path,payload,auth_mode=self.auth_mode,cache=cache)
 
     def http_get_and_parse(self, cmd, payload = {}):
         """
         Call http_get and parse the returned Foscam data into a hash.  The data
         all looks like:  var id='000C5DDC9D6C';
         """
-        ret  = {}
-        data = self.http_get(cmd,payload)
-        self.l_debug("http_get_and_parse","data=%s" % (data))
+        # All the get commands are read only, so they can be cached.
+        data = self.http_get(cmd,payload,cache=True)
+        self.l_debug("http_get_and_parse","data=%s", data)
         if data is False:
+            ret  = {}
             code = -1
         else:
-            # Return code is good, unless CGI result changes it later
-            code = 0
-            root = ET.fromstring(data)
-            for child in root.iter():
-                if child.tag == 'result':
-                    code = int(child.text)
-                elif child.tag != 'CGI_Result':
-                    ret[child.tag] = child.text
-        self.l_debug("http_get_and_parse","code=%d, ret=%s" % (code,ret))
+            ret = parse_cgi_result(data)
+            if ret is None:
+                # Not the simple flat result, let ElementTree figure it out.
+                ret  = {}
+                root = ET.fromstring(data)
+                for child in root.iter():
+                    if child.tag != 'CGI_Result':
+                        ret[child.tag] = child.text
+            # Return code is good, unless CGI result changes it
+            code = int(ret.pop('result')) if 'result' in ret else 0
+        self.l_debug("http_get_and_parse","code=%d, ret=%s", code, ret)
         return code,ret
 
     def save_keys(self, pfx, rc, params):
         """
         Stores the parsed data in the status dict.
         """
-        self.l_debug("save_keys","pfx=%s rc=%d params=%s" % (pfx,rc,params))
+        self.l_debug("save_keys","pfx=%s rc=%d params=%s", pfx, rc, params)
         if pfx not in self.cam_status:
             self.cam_status[pfx] = dict()
         if rc == 0:
             for key in sorted(params.keys()):
-                self.l_debug("save_keys","%s:%s=%s" % (pfx,key,params[key]))
+                self.l_debug("save_keys","%s:%s=%s", pfx, key, params[key])
                 self.cam_status[pfx][key] = params[key]
 
     def http_get_and_parse_keys(self, cmd, pfx = ""):
@@ -263,11 +308,11 @@ class FoscamHD2(polyinterface.Node):
         else:
             cstate = -1
         if 'irled' in self.cam_status and 'mode' in self.cam_status['irled']:
-            self.l_info("get_irled_state","irled_mode=%d" % (int(self.cam_status['irled']['mode'])))
+            self.l_info("get_irled_state","irled_mode=%d", int(self.cam_status['irled']['mode']))
             if int(self.cam_status['irled']['mode']) == 0:
                 self.cam_status['irled_state'] = 0
             elif 'devstate' in self.cam_status and 'infraLedState' in self.cam_status['devstate']:
-                self.l_info("get_irled_state","infraLedState=%d" % (int(self.cam_status['devstate']['infraLedState'])))
+                self.l_info("get_irled_state","infraLedState=%d", int(self.cam_status['devstate']['infraLedState']))
                 if int(self.cam_status['devstate']['infraLedState']) == 0:
                     self.cam_status['irled_state'] = 1
                 else:
@@ -278,7 +323,7 @@ class FoscamHD2(polyinterface.Node):
             self.cam_status['irled_state'] = 3
         if cstate != self.cam_status['irled_state']:
             self.setDriver('GV5', self.cam_status['irled_state'])
-        self.l_info("get_irled_state","irled_state=%d" % (self.cam_status['irled_state']))
+        self.l_info("get_irled_state","irled_state=%d", self.cam_status['irled_state'])
 
     # **********************************************************************
     #
@@ -300,19 +345,28 @@ class FoscamHD2(polyinterface.Node):
 
     def get_cam_dev_info(self,report=True):
         rc = self.http_get_and_parse_keys('getDevInfo',"devinfo")
+        self.check_dev_info(rc)
+        return rc
+
+    def check_dev_info(self,rc):
         # Update sys_ver if it's different
-        self.l_info('get_cam_dev_state','got {0}'.format(rc))
+        self.l_info('get_cam_dev_state','got %s', rc)
         if rc != -2 and rc != -1 and self.full_sys_ver != str(self.cam_status['devinfo']['hardwareVer']):
-            self.l_info("get_cam_dev_info","New sys_ver %s != %s" % (self.full_sys_ver,str(self.cam_status['devinfo']['hardwareVer'])))
+            self.l_info("get_cam_dev_info","New sys_ver %s != %s", self.full_sys_ver, str(self.cam_status['devinfo']['hardwareVer']))
             self.parse_sys_ver(self.cam_status['devinfo']['hardwareVer'])
             self.setDriver('GV11', self.sys_s_ver)
-        return rc
+
+    def get_motion_detect_command(self):
+        return 'getMotionDetectConfig1' if self.amba else 'getMotionDetectConfig'
 
     def get_cam_motion_detect_config(self,report=True):
+        st = self.http_get_and_parse_keys(self.get_motion_detect_command(),'motion_detect')
+        self.set_motion_detect_drivers(st)
+        return st
+
+    def set_motion_detect_drivers(self,st):
         mk = 'motion_detect'
-        command = 'getMotionDetectConfig1' if self.amba else 'getMotionDetectConfig'
-        st = self.http_get_and_parse_keys(command,mk)
-        self.l_info("get_cam_motion_detect_config","st=%d" % (st))
+        self.l_info("get_cam_motion_detect_config","st=%d", st)
         if st == 0:
             self.setDriver('GV6',  int(self.cam_status[mk]['isEnable']))
             if 'sensitivity' in self.cam_status[mk]:
@@ -320,7 +374,7 @@ class FoscamHD2(polyinterface.Node):
             elif 'sensitivity1' in self.cam_status[mk]:
                 self.setDriver('GV8',  int(self.cam_status[mk]['sensitivity1']))
             else:
-                self.l_error('get_cam_motion_detect_config','No sensitivity or sensitivity1 in {}'.format(self.cam_status[mk]))
+                self.l_error('get_cam_motion_detect_config','No sensitivity or sensitivity1 in %s', self.cam_status[mk])
             self.setDriver('GV10', int(self.cam_status[mk]['triggerInterval']))
             self.setDriver('GV13', int(self.cam_status[mk]['snapInterval']))
             if 'linkage' in self.cam_status[mk]:
@@ -330,27 +384,34 @@ class FoscamHD2(polyinterface.Node):
                 self.setDriver('GV4',  isBitI(sl,linkage_bits['record']))
                 self.setDriver('GV0', isBitI(sl,linkage_bits['ring']))
                 self.setDriver('GV15', isBitI(sl,linkage_bits['push']))
-                self.l_debug('get_cam_motion_detect_config','linkage={} ring={} send_mail={} snap_picture={} record={} push={}'.
-                    format(sl,
+                self.l_debug('get_cam_motion_detect_config','linkage=%s ring=%s send_mail=%s snap_picture=%s record=%s push=%s',
+                        sl,
                         isBitI(sl,linkage_bits['ring']),
                         isBitI(sl,linkage_bits['send_mail']),
                         isBitI(sl,linkage_bits['snap_picture']),
                         isBitI(sl,linkage_bits['record']),
                         isBitI(sl,linkage_bits['push']),
-                        ))
+                        )
             else:
-                self.l_error('get_cam_motion_detect_config','No linkage in {}'.format(self.cam_status[mk]))
+                self.l_error('get_cam_motion_detect_config','No linkage in %s', self.cam_status[mk])
         return st
 
     def get_status(self):
-        self.l_info("get_status","%s:%s" % (self.ip,self.port))
-        # Get the led_mode since that is the simplest return status
-        rc = self.get_cam_dev_info(report=True)
-        self.l_info("get_status","rc=%d" % (rc))
+        self.l_info("get_status","%s:%s", self.ip, self.port)
+        # getDevState is needed anyway, so it's the status check once the
+        # static device info is known.
+        if self.caps is None:
+            rc = self.get_cam_dev_info(report=True)
+        else:
+            rc = self.get_cam_dev_state(report=True)
+        self.set_status(rc)
+
+    def set_status(self,rc):
+        self.l_info("get_status","rc=%d", rc)
         if rc == 0:
             connected = True
         else:
-            self.l_error("get_status"," Failed to get_status: %d" % (rc))
+            self.l_error("get_status"," Failed to get_status: %d", rc)
             # inform the motion node there is an issue if we have a motion node
             #if hasattr(self,'motion'):
             #    self.motion.motion(2)
@@ -366,47 +427,130 @@ class FoscamHD2(polyinterface.Node):
         """
         if self.cam_status['product']['modelName'] in IS_AMBA:
             self.amba = IS_AMBA[self.cam_status['product']['modelName']]
-            self.l_info('set_cam_all','Using known Amba setting for {}={}'
-                        .format(self.cam_status['product']['modelName'],self.amba))
+            self.l_info('set_cam_all','Using known Amba setting for %s=%s',
+                        self.cam_status['product']['modelName'],self.amba)
         else:
             # We will assume it is not...
             self.amba = False
-            self.l_info('set_cam_all','Assuming NOT Amba setting for {}={}'
-                        .format(self.cam_status['product']['modelName'],self.amba))
+            self.l_info('set_cam_all','Assuming NOT Amba setting for %s=%s',
+                        self.cam_status['product']['modelName'],self.amba)
         self.l_info('set_cam_all',
-                    "model={}, model_name={}, hardware_ver={}, firmware_ver={}, amba={}"
-                    .format(
-                        self.cam_status['product']['model'],
-                        self.cam_status['product']['modelName'],
-                        self.cam_status['devinfo']['hardwareVer'],
-                        self.cam_status['devinfo']['firmwareVer'],
-                        self.amba
-                    )
+                    "model=%s, model_name=%s, hardware_ver=%s, firmware_ver=%s, amba=%s",
+                    self.cam_status['product']['model'],
+                    self.cam_status['product']['modelName'],
+                    self.cam_status['devinfo']['hardwareVer'],
+                    self.cam_status['devinfo']['firmwareVer'],
+                    self.amba
                 )
+        self.save_capabilities()
+
+    def load_capabilities(self):
+        """
+        Restore the static device info saved by the controller, so query
+        doesn't need to fetch it, unless the discovered sys version is
+        different.
+        """
+        caps = self.controller.get_capabilities(self.address)
+        if caps is None:
+            return
+        if self.disc_sys_ver is not None and caps['sys'] != self.disc_sys_ver:
+            self.l_info("load_capabilities","sys version changed %s -> %s", caps['sys'], self.disc_sys_ver)
+            self.forget_capabilities()
+            return
+        self.disc_sys_ver = caps['sys']
+        self.caps      = caps
+        self.amba      = caps['amba']
+        self.auth_mode = caps['auth_mode']
+        self.cam_status['product'] = {'model': caps['model'], 'modelName': caps['modelName']}
+        self.cam_status['devinfo'] = {'hardwareVer': caps['hardwareVer'], 'firmwareVer': caps['firmwareVer']}
+        if self.full_sys_ver is None and caps['sys'] is not None:
+            self.parse_sys_ver(caps['sys'])
+            self.setDriver('GV11', self.sys_s_ver)
+        self.l_info("load_capabilities","%s", caps)
+
+    def save_capabilities(self):
+        self.caps = {
+            'model':       self.cam_status['product']['model'],
+            'modelName':   self.cam_status['product']['modelName'],
+            'hardwareVer': self.cam_status['devinfo']['hardwareVer'],
+            'firmwareVer': self.cam_status['devinfo']['firmwareVer'],
+            'amba':        self.amba,
+            'auth_mode':   self.auth_mode,
+            'sys':         self.disc_sys_ver,
+        }
+        self.controller.save_capabilities(self.address, self.caps)
+
+    def forget_capabilities(self):
+        self.caps = None
+        self.controller.save_capabilities(self.address, None)
 
     def get_cam_all(self,report=True):
         """
-        Call get_status on the camera and store in status
+        Call all the get commands on the camera at the same time and store
+        the results in status together once they are all done.  The motion
+        config command depends on amba which comes from the product info, so
+        it can only go with the others once the product is known.  The
+        device and product info are only fetched when they aren't saved.
         """
-        self.get_status()
+        caps_known = self.caps is not None
+        amba_known = 'product' in self.cam_status and 'modelName' in self.cam_status['product']
+        calls = [
+            ('devstate', 'getDevState'),
+        ]
+        if not caps_known:
+            calls.append(('devinfo',  'getDevInfo'))
+            calls.append(('product',  'getProductAllInfo'))
+        if amba_known:
+            calls.append(('motion_detect', self.get_motion_detect_command()))
+        results = self.controller.parallel([partial(self.http_get_and_parse,cmd) for pfx,cmd in calls])
+        rcs = {}
+        with self.status_lock:
+            for (pfx,cmd),(rc,data) in zip(calls,results):
+                self.save_keys(pfx,rc,data)
+                rcs[pfx] = rc
+        # getDevState is the status check
+        rc = rcs['devstate']
+        if not caps_known:
+            self.check_dev_info(rcs['devinfo'])
+        self.set_status(rc)
         if self.st:
-            self.get_product_info(report=False)
-            self.get_cam_dev_state(report=False)
-            self.get_cam_dev_info(report=False)
-            self.set_cam_all()
-            self.get_cam_motion_detect_config(report=False)
+            # The devstate we just got has the IR LED and motion state.
+            self.get_irled_state(report=False)
+            if hasattr(self,'motion'):
+                self.motion.set_motion_st(self.get_devstate_motion(rc))
+                self.set_motion_countdown()
+            if not caps_known and rcs['product'] == 0 and rcs['devinfo'] == 0:
+                self.set_cam_all()
+            if amba_known:
+                self.set_motion_detect_drivers(rcs['motion_detect'])
+            else:
+                self.get_cam_motion_detect_config(report=False)
+
+    def runCmd(self, command):
+        """ Let the controller run the command, so it's drivers go out together """
+        return self.controller.run_cmd(self, command)
 
-    def l_info(self, name, string):
-        LOGGER.info("%s:%s:%s: %s" %  (self.id,self.name,name,string))
+    def l_info(self, name, string, *args):
+        if LOGGER.isEnabledFor(logging.INFO):
+            self.l_log(logging.INFO, name, string, args)
 
-    def l_error(self, name, string):
-        LOGGER.error("%s:%s:%s: %s" % (self.id,self.name,name,string))
+    def l_error(self, name, string, *args, exc_info=False):
+        if LOGGER.isEnabledFor(logging.ERROR):
+            self.l_log(logging.ERROR, name, string, args, exc_info=exc_info)
 
-    def l_warning(self, name, string):
-        LOGGER.warning("%s:%s:%s: %s" % (self.id,self.name,name,string))
+    def l_warning(self, name, string, *args):
+        if LOGGER.isEnabledFor(logging.WARNING):
+            self.l_log(logging.WARNING, name, string, args)
 
-    def l_debug(self, name, string):
-        LOGGER.debug("%s:%s:%s: %s" % (self.id,self.name,name,string))
+    def l_debug(self, name, string, *args):
+        if LOGGER.isEnabledFor(logging.DEBUG):
+            self.l_log(logging.DEBUG, name, string, args)
+
+    def l_log(self, level, name, string, args, exc_info=False):
+        """
+        string is only formatted with args if the record is emitted.
+        """
+        camera_log(LOGGER, level, (self.id, self.name, name), string, args, exc_info)
 
     # **********************************************************************
     #
@@ -419,7 +563,7 @@ class FoscamHD2(polyinterface.Node):
         """
         value = command.get("value")
         if value is None:
-            self.l_error("cmd_set_irled","not passed a value: %s" % (value) )
+            self.l_error("cmd_set_irled","not passed a value: %s", value )
             return False
         # TODO: Should use the _driver specified function instead of int.
         if int(value) == 0:
@@ -450,7 +594,7 @@ class FoscamHD2(polyinterface.Node):
         if self.st:
             return True
         else:
-            self.l_error("is_conncted","Camera {0}:{1} is not respoding {2}".format(self.ip,self.port,self.st))
+            self.l_error("is_conncted","Camera %s:%s is not respoding %s", self.ip, self.port, self.st)
             return False
 
     def set_motion_params(self):
@@ -469,11 +613,11 @@ class FoscamHD2(polyinterface.Node):
         return self.set_motion_params_st
 
     def set_motion_param(self, driver=None, param=None, value=None):
-        self.l_debug("set_motion_param","driver={0} param={1} value={2}".format(driver,param,value))
+        self.l_debug("set_motion_param","driver=%s param=%s value=%s", driver, param, value)
         if not self.is_responding():
             return False
         if value is None:
-            self.l_error("set_motion_param","not passed a value: %s" % (value) )
+            self.l_error("set_motion_param","not passed a value: %s", value )
             return False
         self.get_cam_motion_detect_config(report=False)
         self.cam_status['motion_detect'][param] = myint(value)
@@ -481,43 +625,43 @@ class FoscamHD2(polyinterface.Node):
             # TODO: Need the proper uom from the driver?
             self.setDriver(driver, myint(value))
             return True
-        self.l_error("set_motion_param","failed to set %s=%s" % (param,value) )
+        self.l_error("set_motion_param","failed to set %s=%s", param, value )
         return False
 
 
     def set_motion_linkage(self, driver=None, param=None, value=None):
-        self.l_debug("set_motion_linkage","driver={0} param={1} value={2}".format(driver,param,value))
+        self.l_debug("set_motion_linkage","driver=%s param=%s value=%s", driver, param, value)
         if not self.is_responding():
             return False
         if value is None:
-            self.l_error("set_motion_linkage","not passed a value: %s" % (value) )
+            self.l_error("set_motion_linkage","not passed a value: %s", value )
             return False
         if param is None:
-            self.l_error("set_motion_linkage","not passed a param: %s" % (param) )
+            self.l_error("set_motion_linkage","not passed a param: %s", param )
             return False
         if not param in linkage_bits:
-            self.l_error("set_motion_linkage unknown param '%s'" % (param) )
+            self.l_error("set_motion_linkage","unknown param '%s'", param )
             return False
         value = int(value)
         if 'linkage' in self.cam_status['motion_detect']:
             self.get_cam_motion_detect_config(report=False)
             cval = int(self.cam_status['motion_detect']['linkage'])
-            self.l_debug("set_motion_linkage","param=%s value=%s, bit=%d, motion_detect_linkage=%s" % (param,value,linkage_bits[param],cval))
+            self.l_debug("set_motion_linkage","param=%s value=%s, bit=%d, motion_detect_linkage=%s", param, value, linkage_bits[param], cval)
             if value == 0:
                 cval = clearBit(cval,linkage_bits[param])
             else:
                 cval = setBit(cval,linkage_bits[param])
             # TODO: Should use the _driver specified function instead of int.
             self.cam_status['motion_detect']['linkage'] = cval
-            self.l_debug("set_motion_linkage","%d" % (cval))
+            self.l_debug("set_motion_linkage","%d", cval)
             if self.set_motion_params():
-                self.l_debug("set_motion_linkage","setDriver({0},{1})".format(driver, myint(value)))
+                self.l_debug("set_motion_linkage","setDriver(%s,%s)", driver, myint(value))
                 self.setDriver(driver, myint(value))
                 return True
-            self.l_error("set_motion_param","failed to set %s=%s" % ("linkage",cval) )
+            self.l_error("set_motion_param","failed to set %s=%s", "linkage", cval )
             return False
         else:
-            self.l_error("set_motion_param","linkage not found in {}".format(self.cam_status['motion_detect']))
+            self.l_error("set_motion_param","linkage not found in %s", self.cam_status['motion_detect'])
             return False
 
     def cmd_reboot(self, command):
@@ -532,10 +676,10 @@ class FoscamHD2(polyinterface.Node):
         if not self.is_responding():
             return False
         if value is None:
-            self.l_error("_goto_preset not passed a value: %s" % (value) )
+            self.l_error("_goto_preset","not passed a value: %s", value )
             return False
         if not self.http_get("ptzGotoPresetPoint",{"name": int(value)}):
-            self.l_error("cmd_goto_preset","failed to set %s" % (int(value)) )
+            self.l_error("cmd_goto_preset","failed to set %s", int(value) )
         return True
 
     def cmd_set_almoa(self,command):
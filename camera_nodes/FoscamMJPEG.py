@@ -1,13 +1,22 @@
 
 import os
+import logging
 import polyinterface
 from camera_nodes import Motion
+from CameraDrivers import DriverShadow
+from CameraLogging import camera_log
+from CameraParsers import parse_vars
 from functools import partial
 from camera_funcs import myint,myfloat,ip2long,long2ip
 
 LOGGER = polyinterface.LOGGER
 
-class FoscamMJPEG(polyinterface.Node):
+# The only values the node reads from each response.
+PARAMS_KEYS = ('alarm_motion_armed', 'alarm_mail', 'alarm_motion_sensitivity', 'alarm_motion_compensation', 'alarm_upload_interval')
+MISC_KEYS   = ('led_mode',)
+STATUS_KEYS = ('sys_ver', 'alarm_status')
+
+class FoscamMJPEG(DriverShadow, polyinterface.Node):
     """
     This is the class that all the Nodes will be represented by. You will add this to
     Polyglot/ISY with the controller.addNode method.
@@ -23,7 +32,7 @@ class FoscamMJPEG(polyinterface.Node):
     setDriver('ST', 1, report = True, force = False):
         This sets the driver 'ST' to 1. If report is False we do not report it to
         Polyglot/ISY. If force is True, we send a report even if the value hasn't changed.
-    reportDrivers(): Forces a full update of all drivers to Polyglot/ISY.
+    reportDrivers(): Reports drivers not yet sent to Polyglot/ISY, force=True sends all, which query does.
     query(): Called when ISY sends a query request to Polyglot for this specific node
     """
     def __init__(self, controller, user, password, udp_data=None, node_data=None):
@@ -83,7 +92,7 @@ class FoscamMJPEG(polyinterface.Node):
             g_ip    = self.getDriver('GV2')
             g_port  = self.getDriver('GV3')
             g_authm = self.getDriver('GV10')
-            self.l_info("start","ip={0} port={1} auth_mode={2}".format(g_ip,g_port,g_authm))
+            self.l_info("start","ip=%s port=%s auth_mode=%s", g_ip, g_port, g_authm)
             if int(g_ip) == 0:
                 self.l_error("start","The IP address (GV2) was set to zero?  That's not good, you will need to run discover again")
             if int(g_port) == 0:
@@ -91,7 +100,7 @@ class FoscamMJPEG(polyinterface.Node):
             self.ip        = long2ip(int(g_ip))
             self.port      = g_port
             self.auth_mode = int(g_authm)
-            self.l_info("start","ip={0} port={1} auth_mode={2}".format(self.ip,self.port,self.auth_mode))
+            self.l_info("start","ip=%s port=%s auth_mode=%s", self.ip, self.port, self.auth_mode)
             # This will force query to get it
             self.sys_ver      = 0
             self.full_sys_ver = None
@@ -103,19 +112,21 @@ class FoscamMJPEG(polyinterface.Node):
         for param in ('led_mode', 'alarm_motion_armed', 'alarm_mail', 'alarm_motion_sensitivity', 'alarm_motion_compensation', 'alarm_upload_interval'):
             if not param in self.params:
                 self.params[param] = 0
-        # Call query to pull in the params before adding the motion node.
-        self.query();
         # Add my motion node now that the camera is defined.
         self.motion = self.controller.addNode(Motion(self.controller, self, self))
-        # Tell the camera to ping the parent server on motion.
+        # Arm motion then query, along with the other cameras.
+        self.controller.start_camera(self)
+
+    def arm_motion(self):
+        """
+        Tell the camera to ping the parent server on motion.
+        """
         sa = self.parent.rest_server.server.server_address
-        self.set_alarm_params({
+        return self.set_alarm_params({
             'motion_armed': 1,
             'http':         1,
             'http_url':     "http://%s:%s/motion/%s" % (sa[0], sa[1], self.motion.address)
         });
-        # Query again now that we have set paramaters
-        self.query();
 
     def query(self):
         """
@@ -135,7 +146,7 @@ class FoscamMJPEG(polyinterface.Node):
             self.setDriver('GV8', self.params['alarm_motion_sensitivity'])
             self.setDriver('GV9', self.params['alarm_motion_compensation'])
             self.setDriver('GV13', self.params['alarm_upload_interval'])
-        self.reportDrivers()
+        self.reportDrivers(force=True)
         self.l_info("query","done")
         return True
 
@@ -166,9 +177,9 @@ class FoscamMJPEG(polyinterface.Node):
         """
         vnums = sys_ver.split(".")
         if len(vnums) == 4:
-            self.l_debug("parse_sys_ver","{0} 0={1} 1={2} 2={3} 3={4}".format(sys_ver,vnums[0],vnums[1],vnums[2],vnums[3]))
+            self.l_debug("parse_sys_ver","%s 0=%s 1=%s 2=%s 3=%s", sys_ver, vnums[0], vnums[1], vnums[2], vnums[3])
             ver = myfloat("%d.%d" % (int(vnums[2]),int(vnums[3])),2)
-            self.l_debug("parse_sys_ver","ver={}".format(ver))
+            self.l_debug("parse_sys_ver","ver=%s", ver)
             return ver
         else:
             self.l_waning("parse_sys_ver","Unknown sys_Ver{}".format(sys_ver))
@@ -184,58 +195,56 @@ class FoscamMJPEG(polyinterface.Node):
         vnums = sys_ver.split(".")
         if int(vnums[2]) >= 2 and int(vnums[3]) > 52:
             auth_mode = 1
-        self.l_debug("get_auth_mode"," ".format(auth_mode))
+        self.l_debug("get_auth_mode","auth_mode=%s", auth_mode)
         return auth_mode
 
-    def http_get(self, path, payload = {}):
+    def http_get(self, path, payload = {}, cache=False):
         """ Call http_get on this camera for the specified path and payload """
-        return self.parent.http_get(self.ip,self.port,self.user,self.password,path,payload,auth_mode=self.auth_mode)
+        return self.parent.http_get(self.ip,self.port,self.user,self.password,path,payload,auth_mode=self.auth_mode,cache=cache)
 
-    def http_get_and_parse(self, path, payload = {}):
+    def http_get_and_parse(self, path, payload = {}, keys=None):
         """
         Call http_get and parse the returned Foscam data into a hash.  The data
         all looks like:  var id='000C5DDC9D6C';
+        If keys is passed only those are returned.
         """
-        data = self.http_get(path,payload)
+        # All the get_*.cgi calls are read only, so they can be cached.
+        data = self.http_get(path,payload,cache=True)
         if data is False:
             return False
-        ret  = {}
-        for item in data.splitlines():
-            param = item.replace('var ','').replace("'",'').strip(';').split('=')
-            ret[param[0]] = param[1]
-        return ret
+        return parse_vars(data,keys)
 
     def get_params(self):
         """ Call get_params and get_misc on the camera and store in params """
-        params = self.http_get_and_parse("get_params.cgi")
+        params = self.http_get_and_parse("get_params.cgi",keys=PARAMS_KEYS)
         if not params:
             self.l_error("get_params","Failed")
             self.set_st(False)
             return False
         self.set_st(True)
-        self.params = self.http_get_and_parse("get_params.cgi")
-        misc = self.http_get_and_parse("get_misc.cgi")
+        self.params = params
+        misc = self.http_get_and_parse("get_misc.cgi",keys=MISC_KEYS)
         self.params['led_mode'] = misc['led_mode']
 
     def set_alarm_params(self,params):
         """
         Set the sepecified alarm params on the camera
         """
-        self.l_info("set_alarm_params","%s" % (params))
+        self.l_info("set_alarm_params","%s", params)
         return self.http_get("set_alarm.cgi",params)
 
     def set_misc_params(self,params):
         """
         Set the sepecified misc params on the camera
         """
-        self.l_info("set_misc_params"," %s" % (params))
+        self.l_info("set_misc_params"," %s", params)
         return self.http_get("set_misc.cgi",params)
 
     def decoder_control(self,params):
         """
         Pass in decoder command
         """
-        self.l_info("set_decoder_control","%s" % (params))
+        self.l_info("set_decoder_control","%s", params)
         return self.http_get("decoder_control.cgi",params)
 
     def get_motion_status(self):
@@ -261,16 +270,16 @@ class FoscamMJPEG(polyinterface.Node):
         Call get_status on the camera and store in status
         """
         # Can't spit out the device name cause we might not know it yet.
-        self.l_info("get_status","%s:%s" % (self.ip,self.port))
+        self.l_info("get_status","%s:%s", self.ip, self.port)
         # Get the status
-        status = self.http_get_and_parse("get_status.cgi")
+        status = self.http_get_and_parse("get_status.cgi",keys=STATUS_KEYS)
         if status:
             connected = True
             self.cam_status = status
             # Update sys_ver if it's different
             if self.full_sys_ver != str(self.cam_status['sys_ver']):
                 self.l_debug("get_status",self.cam_status)
-                self.l_info("get_status","New sys_ver %s != %s" % (self.full_sys_ver,str(self.cam_status['sys_ver'])))
+                self.l_info("get_status","New sys_ver %s != %s", self.full_sys_ver, str(self.cam_status['sys_ver']))
                 self.full_sys_ver = str(self.cam_status['sys_ver'])
                 new_ver = self.parse_sys_ver(self.cam_status['sys_ver'])
                 if new_ver is not None:
@@ -288,11 +297,11 @@ class FoscamMJPEG(polyinterface.Node):
 
     def set_alarm_param(self, driver=None, param=None, value=None):
         if value is None:
-            self.l_error("set_alarm_param not passed a value: %s" % (value) )
+            self.l_error("set_alarm_param","not passed a value: %s", value )
             return False
         # TODO: Should use the _driver specified function instead of int.
         if not self.set_alarm_params({ param: int(value)}):
-            self.l_error("set_alarm_param","failed to set %s=%s" % (param,value) )
+            self.l_error("set_alarm_param","failed to set %s=%s", param, value )
         # TODO: Dont' think I should be setting the driver?
         self.setDriver(driver, myint(value))
         # The set_alarm param is without the '_alarm' prefix
@@ -301,11 +310,11 @@ class FoscamMJPEG(polyinterface.Node):
 
     def set_misc_param(self, driver=None, param=None, value=None):
         if value is None:
-            self.l_error("set_misc_param"," not passed a value for driver %s: %s" % (driver, value) )
+            self.l_error("set_misc_param"," not passed a value for driver %s: %s", driver, value )
             return False
         # TODO: Should use the _driver specified function instead of int.
         if not self.set_misc_params({ param: int(value)}):
-            self.l_error("set_misc_param"," failed to set %s=%s" % (param,value) )
+            self.l_error("set_misc_param"," failed to set %s=%s", param, value )
         # TODO: Dont' think I should be setting the driver?
         self.setDriver(driver, myint(value))
         # The set_misc param
@@ -320,7 +329,7 @@ class FoscamMJPEG(polyinterface.Node):
         """ Set the irled off=94 on=95 """
         value = int(command.get("value"))
         if value is None:
-            self.l_error("cmd_set_irled"," not passed a value: %s" % (value) )
+            self.l_error("cmd_set_irled"," not passed a value: %s", value )
             return False
         if value == 0:
             dvalue = 94
@@ -330,14 +339,14 @@ class FoscamMJPEG(polyinterface.Node):
             # TODO: Not storing this cause the camera doesn't allow us to query it.
             #self.setDriver("GVxx", myint(value))
             return True
-        self.l_error("cmd_set_irled","failed to set %s" % (dvalue) )
+        self.l_error("cmd_set_irled","failed to set %s", dvalue )
         return False
 
     def cmd_set_authm(self, command):
         """ Set the auth mode 0=Basic 1=Digest """
         value = int(command.get("value"))
         if value is None:
-            self.l_error("cmd_set_authm"," not passed a value: %s" % (value) )
+            self.l_error("cmd_set_authm"," not passed a value: %s", value )
             return False
         self.auth_mode = int(value)
         self.l_debug("set_authm",self.auth_mode)
@@ -358,25 +367,39 @@ class FoscamMJPEG(polyinterface.Node):
         """
         value = int(command.get("value"))
         if value is None:
-            self.l_error("cmd_goto_preset"," not passed a value: %s" % (value) )
+            self.l_error("cmd_goto_preset"," not passed a value: %s", value )
             return False
         value * 2 + 29
         value = myint((value * 2) + 29)
         if not self.decoder_control( { 'command': value} ):
-            self.l_error("cmd_goto_preset"," failed to set %s" % (value) )
+            self.l_error("cmd_goto_preset"," failed to set %s", value )
         return True
 
-    def l_info(self, name, string):
-        LOGGER.info("%s:%s:%s: %s" %  (self.id,self.name,name,string))
+    def runCmd(self, command):
+        """ Let the controller run the command, so it's drivers go out together """
+        return self.controller.run_cmd(self, command)
 
-    def l_error(self, name, string):
-        LOGGER.error("%s:%s:%s: %s" % (self.id,self.name,name,string))
+    def l_info(self, name, string, *args):
+        if LOGGER.isEnabledFor(logging.INFO):
+            self.l_log(logging.INFO, name, string, args)
 
-    def l_warning(self, name, string):
-        LOGGER.warning("%s:%s:%s: %s" % (self.id,self.name,name,string))
+    def l_error(self, name, string, *args, exc_info=False):
+        if LOGGER.isEnabledFor(logging.ERROR):
+            self.l_log(logging.ERROR, name, string, args, exc_info=exc_info)
 
-    def l_debug(self, name, string):
-        LOGGER.debug("%s:%s:%s: %s" % (self.id,self.name,name,string))
+    def l_warning(self, name, string, *args):
+        if LOGGER.isEnabledFor(logging.WARNING):
+            self.l_log(logging.WARNING, name, string, args)
+
+    def l_debug(self, name, string, *args):
+        if LOGGER.isEnabledFor(logging.DEBUG):
+            self.l_log(logging.DEBUG, name, string, args)
+
+    def l_log(self, level, name, string, args, exc_info=False):
+        """
+        string is only formatted with args if the record is emitted.
+        """
+        camera_log(LOGGER, level, (self.id, self.name, name), string, args, exc_info)
 
     def cmd_set_ledm(self,command):
         self.set_misc_param(driver="GV5", param='led_mode', value=command.get("value"))
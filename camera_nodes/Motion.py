@@ -1,8 +1,13 @@
 
 import polyinterface
+import threading, time
 from camera_funcs import myint
+from CameraDrivers import DriverShadow
 
-class Motion(polyinterface.Node):
+# Seconds motion stays on after the last callback before the camera is checked.
+MOTION_TIMEOUT = 30
+
+class Motion(DriverShadow, polyinterface.Node):
     """ Node that monitors motion """
 
     def __init__(self, controller, parent, primary):
@@ -10,51 +15,140 @@ class Motion(polyinterface.Node):
         address = primary.address + "m";
         self.pnode = primary
         self.motion_st  = 0
+        self.timer_lock = threading.Lock()
+        self.timer      = None
+        self.deadline   = 0
         super(Motion, self).__init__(controller, primary.address, address, name)
 
     def start(self):
-        self.query()
+        self.controller.start_camera(self)
 
     def query(self):
-        """ query the motion status camera """
+        """ query the motion status camera and report all drivers """
         # pylint: disable=unused-argument
+        ret = self.check_motion()
+        self.reportDrivers(force=True)
+        return ret
+
+    def check_motion(self):
+        """ Get the motion status from the camera, called by the timer and polls """
         self.pnode.l_debug("Motion:query:","...")
         cm = self.pnode.get_motion_status()
         if cm != self.motion_st:
             self.motion_st = cm
             self.setDriver('ST', self.motion_st)
-        self.pnode.l_debug("Motion:query:"," ST=%s" % (self.motion_st))
+        if cm == 1:
+            # Still on, check again when the timer runs out.
+            self.arm_timer()
+        self.pnode.l_debug("Motion:query:"," ST=%s", self.motion_st)
         if cm == 3:
             return False
         return True
 
     def motion(self, value):
         """ motion detected on the camera, set the status so we start poling """
-        self.motion_st = int(value)
-        self.pnode.l_debug("Motion:motion:","Motion==%s" % (self.motion_st))
-        self.pnode.set_motion_status(self.motion_st)
+        value = int(value)
+        self.pnode.l_debug("Motion:motion:","Motion==%s", value)
+        self.pnode.set_motion_status(value)
+        if value == 1:
+            # Each callback pushes back the auto off.
+            self.arm_timer()
+        else:
+            self.cancel_timer()
+        # Only publish transitions
+        if value == self.motion_st:
+            return True
+        self.motion_st = value
         return self.setDriver('ST', self.motion_st)
 
+    def set_motion_st(self, value):
+        """
+        Called by cameras that track their own motion state.
+        """
+        if value != self.motion_st:
+            self.motion_st = value
+            self.setDriver('ST', self.motion_st)
+
+    def camera_tracks_motion(self):
+        """
+        True if the camera keeps it's own motion state up to date, so
+        neither the timer or shortPoll need to check it.
+        """
+        return getattr(self.pnode,'tracks_motion',lambda: False)()
+
+    def get_timeout(self):
+        return getattr(self.controller,'motion_timeout',MOTION_TIMEOUT)
+
+    def arm_timer(self):
+        """
+        Start the auto off timer, or push it back if it's already running.
+        Does nothing when motion_timeout is 0, which means shortPoll checks
+        the camera instead, or when the camera tracks it's own motion.
+        """
+        timeout = self.get_timeout()
+        if timeout <= 0 or self.camera_tracks_motion():
+            return
+        with self.timer_lock:
+            self.deadline = time.time() + timeout
+            if self.timer is None:
+                self.start_timer(timeout)
+
+    def start_timer(self, timeout):
+        # Must be called with timer_lock held.
+        self.timer = threading.Timer(timeout, self.timer_expired)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def cancel_timer(self):
+        with self.timer_lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+
+    def timer_armed(self):
+        return self.timer is not None
+
+    def timer_expired(self):
+        """
+        No callback for motion_timeout seconds, so check the camera once.
+        """
+        with self.timer_lock:
+            if self.timer is None:
+                return
+            remaining = self.deadline - time.time()
+            if remaining > 0.1:
+                # A callback came in since the timer was started.
+                self.start_timer(remaining)
+                return
+            self.timer = None
+        self.pnode.l_info("Motion:timer","Check Motion")
+        self.controller.run_camera(self.primary, self.check_motion)
+
+    def runCmd(self, command):
+        """ Let the controller run the command, so it's drivers go out together """
+        return self.controller.run_cmd(self, command)
+
     def shortPoll(self):
         """ 
         poll called by polyglot 
-        - If motion is on then query the camera to see if it's still on
+        - If motion is on then query the camera to see if it's still on,
+          unless the auto off timer is going to do that.
         """
         #self.pnode.l_debug("Motion:poll:%s: Motion=%d" % (self.name,self.motion_st))
-        if self.motion_st == 1:
+        if self.motion_st == 1 and not self.timer_armed() and not self.camera_tracks_motion():
             self.pnode.l_info("Motion:poll","Check Motion")
-            self.query()
+            self.check_motion()
         return True
 
     def longPoll(self):
         """
         Motion doesn't do long poll cause the camera handles it
         """
-        self.pnode.l_info("Motion:long_poll:%s:" % (self.name))
+        self.pnode.l_info("Motion:long_poll","%s:", self.name)
         # Only check motion if it's unknown
         if self.motion_st == 2:
             self.pnode.l_info("Motion:long_poll","Check Motion")
-            self.query()
+            self.check_motion()
         return True
     
     drivers = [
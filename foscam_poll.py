@@ -8,128 +8,275 @@ import socket
 import sys
 import time
 import select
-from struct import unpack,pack
-from camera_funcs import get_valid_node_name,get_network_bcast
+import selectors
+from struct import unpack,pack,Struct
+from collections import namedtuple
+from camera_funcs import get_valid_node_name,get_network_bcast,get_network_interfaces
 
 TIMEOUT = 6 # Run for 30 seconds max.
 PING_INTERVAL    = 2  # Once every 5 seconds
 PING_PORT_NUMBER = 10000
 PING_MSG_SIZE    = 130
+QUIET_TIME       = 1.5 # Stop after this many seconds without a new camera, when expecting cameras.
 
 # ftp://109.108.88.53/Nadzor/FOSCAM/SDK%20CGI/MJPEG%20CGI%20SDK/MJPEG%20CGI%20SDK/Ipcamera%20device%20search%20protocol.pdf
 SEARCH_REQUEST = pack('>4sH?8sll4s', b'MO_I', 0, 0, b'', 67108864, 0, b'')
 
-def foscam_poll(logger=None,verbose=False):
+# The header, id, name, ip, mask, gateway, dns, reserve, sys, app, port and dhcp
+# fields that start every search reply.
+REPLY_FORMAT = '>23s13s21s4I4b4b4bH?'
+# Search reply decoders keyed by reply length: (Struct, mtype, index of type field)
+#  121: I can't find documentation for the last 19 and 14 bytes, but the 14 seems to
+#       be a string that indicates what type of camera A=HD and b=H.264
+#       I see this for my FI9828P V2
+#  129: And this has has another 8 bytes at the end?  I see this on my FI9826P V2
+DECODERS = {
+    88:  (Struct(REPLY_FORMAT),            "MJPEG", None),
+    121: (Struct(REPLY_FORMAT + '19s14s'),   "HD2",   22),
+    129: (Struct(REPLY_FORMAT + '19s14s8s'), "HD2",   22),
+}
+# Offset of the ip in the reply, which is passed straight to inet_ntoa
+# instead of unpacking and packing it again.
+IP_OFFSET = 23 + 13 + 21
 
-    clients = []
-    clients_by_addr = {}
+# Compact record of one reply, mask, gateway and dns are left as int's
+# since only reply_to_client needs them as strings.
+FoscamReply = namedtuple('FoscamReply', 'mtype type id name ip port mask gateway dns reserve_a sys_a app_a dhcp')
 
-    #myip = get_network_ip(logger=logger)
-    mybcast = get_network_bcast(logger=logger)
+def foscam_poll(logger=None,verbose=False,expected=None,quiet=None,interfaces=None):
+    """
+    Returns the list of all cameras found, see foscam_scan
+    """
+    return list(foscam_scan(logger=logger,verbose=verbose,expected=expected,quiet=quiet,interfaces=interfaces))
 
-    # Create UDP socket
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+def get_broadcasts(interfaces=None,logger=None):
+    """
+    Return the broadcast addresses to search on.  All interfaces, or the
+    named interfaces when passed, falling back to the default interface.
+    """
+    bcasts = []
+    try:
+        for iface in get_network_interfaces(names=interfaces,logger=logger):
+            if iface['broadcast'] not in bcasts:
+                bcasts.append(iface['broadcast'])
+    except Exception as err:
+        if logger is not None:
+            logger.error("get_broadcasts: failed: {}".format(err))
+    if not bcasts:
+        bcast = get_network_bcast(logger=logger)
+        if bcast:
+            bcasts.append(bcast)
+    return bcasts
 
-    # Ask operating system to let us do broadcasts from socket
-    sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+def foscam_scan(logger=None,verbose=False,expected=None,quiet=None,interfaces=None):
+    """
+    Generator that broadcasts the search request and yields each camera
+    as soon as it's reply arrives.  By default it runs for TIMEOUT seconds.
+    When expected, a non-empty collection of camera id's, is passed it stops
+    as soon as all of them have answered, and once any camera has answered
+    it also stops when nothing new has come in for quiet (default QUIET_TIME)
+    seconds.
+    All interfaces, or the list of interface names passed in, are searched at
+    the same time and cameras are only returned once.
+    """
+    # No cameras expected, like the first discover, must run the full scan.
+    if expected:
+        expected = set(id.lower() for id in expected)
+        if quiet is None:
+            quiet = QUIET_TIME
+    else:
+        expected = None
 
-    # Bind UDP socket to local port so we can receive pings
-    sock.bind(('',0)) # Was, PING_PORT_NUMBER, but sender can be any open port.
-    # Use timeout
-    sock.settimeout(PING_INTERVAL)
+    #myip = get_network_ip(logger=logger)
+    bcasts = get_broadcasts(interfaces=interfaces,logger=logger)
+
+    # One UDP socket for each broadcast address, all watched by one selector
+    sel   = selectors.DefaultSelector()
+    socks = []
+    for bcast in bcasts:
+        # Create UDP socket
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        # Ask operating system to let us do broadcasts from socket
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        # Bind UDP socket to local port so we can receive pings
+        sock.bind(('',0)) # Was, PING_PORT_NUMBER, but sender can be any open port.
+        sock.setblocking(False)
+        sel.register(sock, selectors.EVENT_READ, bcast)
+        socks.append((sock,bcast))
 
     main_timeout = time.time() + TIMEOUT
-    responses = {}
-    while time.time() < main_timeout:
+    responses = set()
+    found     = set()
+    last_new  = None
+    try:
+        while time.time() < main_timeout:
 
-        # Broadcast our beacon
-        if logger is not None:
-            logger.info("Pinging for Foscams {}:{}".format(mybcast,PING_PORT_NUMBER))
-        sock.sendto(SEARCH_REQUEST, 0, (mybcast, PING_PORT_NUMBER))
+            # Broadcast our beacon
+            for sock, bcast in socks:
+                if logger is not None:
+                    logger.info("Pinging for Foscams {}:{}".format(bcast,PING_PORT_NUMBER))
+                try:
+                    sock.sendto(SEARCH_REQUEST, 0, (bcast, PING_PORT_NUMBER))
+                except socket.error as err:
+                    if logger is not None:
+                        logger.error("Ping to {} failed: {}".format(bcast,err))
 
-        ping_timeout = time.time() + PING_INTERVAL
+            ping_timeout = min(time.time() + PING_INTERVAL, main_timeout)
 
-        while time.time() < ping_timeout:
+            while True:
+                now  = time.time()
+                wait = ping_timeout - now
+                if quiet is not None and last_new is not None:
+                    if now - last_new >= quiet:
+                        if logger is not None:
+                            logger.debug("No new responses for {}s, done looking".format(quiet))
+                        return
+                    wait = min(wait, last_new + quiet - now)
+                if wait <= 0:
+                    break
 
-            # Listen for a response with timeout
-            addr = None
-            try:
-                msg, (addr, uport) = sock.recvfrom(PING_MSG_SIZE)
-                # Someone answered our ping, store it.
-                if addr not in responses:
+                # Listen for a response on all sockets with timeout
+                events = sel.select(wait)
+                if not events:
                     if logger is not None:
-                        logger.info("Saving response from %s:%s" % (addr,uport))
-                    responses[addr] = msg
-            except socket.timeout:
-                if logger is not None:
-                    logger.debug("No more reponses")
-    sock.close()
-    if logger is not None:
-        logger.debug("All done looking")
+                        logger.debug("No more reponses")
+                    continue
+                for key, mask in events:
+                    try:
+                        msg, (addr, uport) = key.fileobj.recvfrom(PING_MSG_SIZE)
+                    except socket.error:
+                        continue
+                    # Someone answered our ping, decode it once.
+                    if addr in responses:
+                        continue
+                    responses.add(addr)
+                    if logger is not None:
+                        logger.info("Saving response from %s:%s on %s" % (addr,uport,key.data))
+                    client = decode_response(msg,addr,logger=logger,verbose=verbose)
+                    if client is None:
+                        continue
+                    # Same camera may answer on more than one network
+                    id = client['id'].lower()
+                    if id in found:
+                        continue
+                    last_new = time.time()
+                    found.add(id)
+                    yield client
+                    if expected and expected <= found:
+                        if logger is not None:
+                            logger.debug("All {} expected cameras answered, done looking".format(len(expected)))
+                        return
+    finally:
+        for sock, bcast in socks:
+            sel.unregister(sock)
+            sock.close()
+        sel.close()
+        if logger is not None:
+            logger.debug("All done looking")
+
+def decode_reply(msg):
+    """
+    Decode one search reply into a compact FoscamReply, returns None for
+    our own echo or unknown messages.
+    """
+    decoder = DECODERS.get(len(msg))
+    if decoder is None:
+        return None
+    upk = decoder[0].unpack(msg)
+    return FoscamReply(
+        decoder[1],
+        "" if decoder[2] is None else upk[decoder[2]],
+        upk[1].decode().rstrip('\x00'),
+        upk[2].decode().rstrip('\x00'),
+        socket.inet_ntoa(msg[IP_OFFSET:IP_OFFSET+4]),
+        upk[19],
+        upk[4],
+        upk[5],
+        upk[6],
+        upk[7:11],
+        upk[11:15],
+        upk[15:19],
+        upk[20],
+    )
 
-    for addr, msg in iter(responses.items()):
+def decode_replies(msgs):
+    """
+    Batch decode a list of raw replies into FoscamReply records, skipping
+    anything that is not a camera reply.
+    """
+    return [rec for rec in map(decode_reply, msgs) if rec is not None]
 
+def reply_to_client(rec):
+    """
+    Convert a FoscamReply into the camera info dict used by the nodes.
+    """
+    return {
+        'type':      rec.type,
+        'mtype':     rec.mtype,
+        'id':        rec.id,
+        'name':      get_valid_node_name(rec.name),
+        'ip':        rec.ip,
+        'port':      rec.port,
+        'mask':      socket.inet_ntoa(pack('!I',rec.mask)),
+        'gateway':   socket.inet_ntoa(pack('!I',rec.gateway)),
+        'dns':       socket.inet_ntoa(pack('!I',rec.dns)),
+        'reserve':   "%d.%d.%d.%d" % rec.reserve_a,
+        'sys':       "%d.%d.%d.%d" % rec.sys_a,
+        'app':       "%d.%d.%d.%d" % rec.app_a,
+        'dhcp':      rec.dhcp,
+        'reserve_a': rec.reserve_a,
+        'sys_a':     rec.sys_a,
+        'app_a':     rec.app_a,
+    }
+
+def decode_response(msg,addr=None,logger=None,verbose=False):
+    """
+    Decode one search reply into the camera info dict, returns None for
+    our own echo or unknown messages.
+    """
+    if logger is not None:
+        logger.debug("Response from: %s" % (addr))
+        if verbose:
+            logger.debug("msg=%s" % msg)
+    if msg == SEARCH_REQUEST:
         if logger is not None:
-            logger.debug("Response from: %s" % (addr))
-            if verbose:
-                logger.debug("msg=%s" % msg)
-
-        if msg == SEARCH_REQUEST:
-            if logger is not None:
-                logger.debug("ignore my echo")
-        elif len(msg) == 88 or len(msg) == 121 or len(msg) == 129:
-            if len(msg) == 88:
-                upk = unpack('>23s13s21s4I4b4b4bH?',msg)
-                (header, id, name, ip_i, mask_i, gateway_i, dns_i, r1, r2, r3, r4, s1, s2, s3, s4, a1, a2, a3, a4, port, dhcp) = upk
-                type = ""
-                mtype = "MJPEG"
-            elif len(msg) == 121:
-                # I can't find documentation for the last 19 and 14 bytes, but the 14 seems to
-                # be a string that indicates what type of camera A=HD and b=H.264
-                # I see this for my FI9828P V2
-                upk = unpack('>23s13s21s4I4b4b4bH?19s14s',msg)
-                (header, id, name, ip_i, mask_i, gateway_i, dns_i, r1, r2, r3, r4, s1, s2, s3, s4, a1, a2, a3, a4, port, dhcp, unknown, type) = upk
-                mtype = "HD2"
-            elif len(msg) == 129:
-                # And this has has another 8 bytes at the end?  I see this on my FI9826P V2
-                upk = unpack('>23s13s21s4I4b4b4bH?19s14s8s',msg)
-                (header, id, name, ip_i, mask_i, gateway_i, dns_i, r1, r2, r3, r4, s1, s2, s3, s4, a1, a2, a3, a4, port, dhcp, unknown1, type, unknown2) = upk
-                mtype = "HD2"
-            if verbose and logger is not None:
-                logger.debug(upk)
-            #type = type.decode()
-            id = id.decode()
-            name = name.decode()
-            client = {
-                'type':      type,#rstrip(b'\x00'),
-                'mtype':     mtype,
-                'id':        id.rstrip('\x00'),
-                'name':      get_valid_node_name(name.rstrip('\x00')),
-                'ip':        socket.inet_ntoa(pack('!I',ip_i)),
-                'port':      port,
-                'mask':      socket.inet_ntoa(pack('!I',mask_i)),
-                'gateway':   socket.inet_ntoa(pack('!I',gateway_i)),
-                'dns':       socket.inet_ntoa(pack('!I',dns_i)),
-                'reserve':   "%d.%d.%d.%d" % (r1, r2, r3, r4),
-                'sys':       "%d.%d.%d.%d" % (s1, s2, s3, s4),
-                'app':       "%d.%d.%d.%d" % (a1, a2, a3, a4),
-                'dhcp':      dhcp,
-                'reserve_a': (r1, r2, r3, r4),
-                'sys_a':     (s1, s2, s3, s4),
-                'app_a':     (a1, a2, a3, a4),
-            }
-            if logger is not None:
-                logger.info("Foscam Info: %s" % (client))
-            clients.append(client)
-        else:
-            if logger is not None:
-                logger.debug("Ignoring message of size " + str(len(msg)))
+            logger.debug("ignore my echo")
+        return None
+    rec = decode_reply(msg)
+    if rec is None:
+        if logger is not None:
+            logger.debug("Ignoring message of size " + str(len(msg)))
+        return None
+    if verbose and logger is not None:
+        logger.debug(rec)
+    client = reply_to_client(rec)
+    if logger is not None:
+        logger.info("Foscam Info: %s" % (client))
+    return client
 
-    return clients
+def benchmark(count=10000):
+    """
+    Decode count synthetic replies of all known sizes and print the rate.
+    """
+    msgs = []
+    for i in range(count):
+        base = pack(REPLY_FORMAT, b'MO_I', ('00626E%06X' % i).encode(), ('Cam%d' % i).encode(),
+                    0x0a000000 + i, 0xffffff00, 0x0a000001, 0x08080808,
+                    0, 0, 0, 0, 11, 37, 2, 55, 2, 4, 10, 5, 88, True)
+        size = (88, 121, 129)[i % 3]
+        msgs.append(base + b'\x00' * (size - len(base)))
+    st = time.perf_counter()
+    recs = decode_replies(msgs)
+    decode_time = time.perf_counter() - st
+    st = time.perf_counter()
+    for rec in recs:
+        reply_to_client(rec)
+    client_time = time.perf_counter() - st
+    print("decoded {0} replies in {1:.1f}ms ({2:.2f}us each), to dicts in {3:.1f}ms ({4:.2f}us each)".format(
+        len(recs), decode_time * 1000, decode_time / count * 1e6, client_time * 1000, client_time / count * 1e6))
 
 if __name__ == '__main__':
     import logging
-    import sys
     # Create our logger
     logger = logging.getLogger('foscam_poll')
     logger.setLevel(logging.DEBUG)
@@ -142,6 +289,16 @@ if __name__ == '__main__':
     # add the handlers to the logger
     logger.addHandler(ch)
     verbose = False
-    if (len(sys.argv) > 1 and sys.argv[1] == "-v"):
-        verbose = True
-    foscam_poll(logger,verbose)
+    expected = None
+    if (len(sys.argv) > 1 and sys.argv[1] == "-b"):
+        # Micro benchmark of the reply decoder
+        benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 10000)
+        sys.exit(0)
+    for arg in sys.argv[1:]:
+        if arg == "-v":
+            verbose = True
+        else:
+            # Any other args are the camera id's we expect to answer
+            expected = (expected or []) + [arg]
+    for client in foscam_scan(logger,verbose,expected=expected):
+        print(client['id'],client['name'],client['ip'],client['port'])
@@ -0,0 +1,5 @@
+
+import os, sys
+
+# The modules live at the top of the repo, next to camera-poly.py.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
@@ -0,0 +1,50 @@
+
+import threading
+from CameraDrivers import DriverShadow
+
+class FakeNode():
+    """ The parts of polyinterface.Node that DriverShadow uses """
+    def __init__(self):
+        self.drivers   = [{'driver': 'ST', 'value': 0}, {'driver': 'GV1', 'value': 0}]
+        self.published = []
+    def setDriver(self, driver, value, report=True, force=False, uom=None):
+        for d in self.drivers:
+            if d['driver'] == driver:
+                d['value'] = value
+        if report:
+            self.published.append((driver, value))
+        return True
+    def reportDrivers(self):
+        for d in self.drivers:
+            self.published.append((d['driver'], d['value']))
+
+class Node(DriverShadow, FakeNode):
+    pass
+
+def test_batch_publishes_final_value_once():
+    node = Node()
+    with node.driver_batch():
+        node.setDriver('ST', 1)
+        node.setDriver('ST', 2)
+        assert node.published == []
+        assert node.drivers[0]['value'] == 2
+    assert node.published == [('ST', 2)]
+
+def test_batch_only_holds_back_its_own_thread():
+    node    = Node()
+    started = threading.Event()
+    done    = threading.Event()
+    def batched():
+        with node.driver_batch():
+            node.setDriver('ST', 1)
+            started.set()
+            done.wait(5)
+    thread = threading.Thread(target=batched)
+    thread.start()
+    started.wait(5)
+    # Another thread isn't in the batch, so it goes out right away.
+    node.setDriver('GV1', 1)
+    assert node.published == [('GV1', 1)]
+    done.set()
+    thread.join(5)
+    assert node.published == [('GV1', 1), ('ST', 1)]
@@ -0,0 +1,48 @@
+
+import logging
+from CameraLogging import CameraLogQueue,RateLimitFilter,camera_log
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super(ListHandler, self).__init__()
+        self.messages = []
+    def emit(self,record):
+        self.messages.append(record.getMessage())
+
+def test_log_queue_delivers_all_records():
+    logger  = logging.getLogger('test_log_queue')
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    handler = ListHandler()
+    logger.addHandler(handler)
+    # The same logger twice, like polyinterface.LOGGER and the root logger.
+    log_queue = CameraLogQueue([logger, logger])
+    log_queue.start()
+    assert handler not in logger.handlers
+    for i in range(100):
+        logger.info("record %d", i)
+    log_queue.stop()
+    assert handler.messages == ["record {0}".format(i) for i in range(100)]
+    assert logger.handlers == [handler]
+    logger.removeHandler(handler)
+
+def test_rate_limit_keeps_different_messages_apart():
+    logger  = logging.getLogger('test_rate_limit')
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    handler = ListHandler()
+    handler.addFilter(RateLimitFilter(period=60))
+    logger.addHandler(handler)
+    prefix  = ('cam1', 'CamFamilyRoom', 'start')
+    # Same node and function, no args, like two l_error calls in start.
+    camera_log(logger, logging.ERROR, prefix, "The IP address (GV2) was set to zero? 100%", ())
+    camera_log(logger, logging.ERROR, prefix, "The port (GV3) was set to zero?", ())
+    camera_log(logger, logging.ERROR, prefix, "The port (GV3) was set to zero?", ())
+    camera_log(logger, logging.ERROR, prefix, "connect to %s failed: %s", ('http://cam1', 'timeout'))
+    camera_log(logger, logging.ERROR, prefix, "connect to %s failed: %s", ('http://cam1', 'refused'))
+    assert handler.messages == [
+        "cam1:CamFamilyRoom:start: The IP address (GV2) was set to zero? 100%",
+        "cam1:CamFamilyRoom:start: The port (GV3) was set to zero?",
+        "cam1:CamFamilyRoom:start: connect to http://cam1 failed: timeout",
+    ]
+    logger.removeHandler(handler)
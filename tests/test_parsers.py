@@ -0,0 +1,137 @@
+
+import pytest
+import xml.etree.ElementTree as ET
+from CameraParsers import parse_cgi_result, parse_vars
+
+#
+# FoscamHD2 CGIProxy.fcgi responses
+#
+GET_DEV_STATE = """<CGI_Result>
+    <result>0</result>
+    <IOAlarm>0</IOAlarm>
+    <motionDetectAlarm>1</motionDetectAlarm>
+    <soundAlarm>0</soundAlarm>
+    <record>0</record>
+    <sdState>0</sdState>
+    <sdFreeSpace>0k</sdFreeSpace>
+    <sdTotalSpace>0k</sdTotalSpace>
+    <ntpState>1</ntpState>
+    <ddnsState>0</ddnsState>
+    <url></url>
+    <upnpState>0</upnpState>
+    <isWifiConnected>0</isWifiConnected>
+    <wifiConnectedAP></wifiConnectedAP>
+    <infraLedState>0</infraLedState>
+</CGI_Result>
+"""
+
+GET_DEV_INFO = """<CGI_Result>
+    <result>0</result>
+    <productName>FI9828P+V2</productName>
+    <serialNo>0000000000000001</serialNo>
+    <devName>CamFamilyRoom</devName>
+    <mac>C4D655000000</mac>
+    <year>2018</year>
+    <mon>12</mon>
+    <day>7</day>
+    <hour>18</hour>
+    <min>59</min>
+    <sec>8</sec>
+    <timeZone>28800</timeZone>
+    <firmwareVer>1.5.3.16</firmwareVer>
+    <hardwareVer>1.12.5.2</hardwareVer>
+</CGI_Result>
+"""
+
+GET_MOTION_DETECT_CONFIG = """<CGI_Result><result>0</result><isEnable>1</isEnable><linkage>12</linkage><snapInterval>2</snapInterval><sensitivity>1</sensitivity><triggerInterval>5</triggerInterval><schedule0>281474976710655</schedule0><area0>1023</area0><empty/></CGI_Result>"""
+
+GET_FAILED = """<CGI_Result>
+    <result>-2</result>
+</CGI_Result>"""
+
+# Not the flat shape, parse_cgi_result must leave these to ElementTree.
+NOT_FLAT = [
+    "<CGI_Result><result>0</result><devName>Cam &amp; Garage</devName></CGI_Result>",
+    "<CGI_Result><result>0</result><list><item>1</item></list></CGI_Result>",
+    "<CGI_Result><result>0</result><!-- comment --><a>1</a></CGI_Result>",
+    "<CGI_Result><result>0</result>stray<a>1</a></CGI_Result>",
+]
+
+def parse_et(data):
+    """ What FoscamHD2.http_get_and_parse did before parse_cgi_result """
+    ret = {}
+    root = ET.fromstring(data)
+    for child in root.iter():
+        if child.tag != 'CGI_Result':
+            ret[child.tag] = child.text
+    return ret
+
+@pytest.mark.parametrize('data', [GET_DEV_STATE, GET_DEV_INFO, GET_MOTION_DETECT_CONFIG, GET_FAILED])
+def test_parse_cgi_result_matches_elementtree(data):
+    assert parse_cgi_result(data) == parse_et(data)
+
+@pytest.mark.parametrize('data', NOT_FLAT)
+def test_parse_cgi_result_falls_back(data):
+    assert parse_cgi_result(data) is None
+    # And ElementTree can still handle it.
+    parse_et(data)
+
+#
+# FoscamMJPEG get_*.cgi responses
+#
+GET_PARAMS = """var id='000C5DDC9D6C';
+var sys_ver='11.37.2.65';
+var app_ver='2.0.10.7';
+var alias='CamOutside';
+var now=1544238912;
+var tz=28800;
+var alarm_motion_armed=1;
+var alarm_motion_sensitivity=5;
+var alarm_motion_compensation=0;
+var alarm_mail=0;
+var alarm_upload_interval=0;
+var alarm_http=1;
+var alarm_http_url='http://192.168.1.10:9000/motion/000c5ddc9d6cm';
+"""
+
+GET_STATUS = "var id='000C5DDC9D6C';\r\nvar sys_ver='11.37.2.65';\r\nvar app_ver='2.0.10.7';\r\nvar alias='CamOutside';\r\nvar alarm_status=0;\r\nvar ddns_status=0;\r\n"
+
+GET_MISC = "var led_mode=1;\nvar ptz_center_onstart=0;\nvar ptz_patrol_rate=20;\n"
+
+# Truncated and junk lines mixed in with good ones.
+MALFORMED = """var id='000C5DDC9D6C';
+<html>
+var sys_ver='11.37.2.65';
+
+var alias
+var alarm_status=1;
+"""
+
+# What FoscamMJPEG asks for from get_params.cgi and get_status.cgi
+PARAMS_KEYS = ('alarm_motion_armed', 'alarm_mail', 'alarm_motion_sensitivity', 'alarm_motion_compensation', 'alarm_upload_interval')
+STATUS_KEYS = ('sys_ver', 'alarm_status')
+
+def parse_split(data):
+    """ What FoscamMJPEG.http_get_and_parse did before VAR_RE """
+    ret = {}
+    for item in data.splitlines():
+        param = item.replace('var ','').replace("'",'').strip(';').split('=')
+        ret[param[0]] = param[1]
+    return ret
+
+@pytest.mark.parametrize('data', [GET_PARAMS, GET_STATUS, GET_MISC])
+def test_parse_vars_matches_split(data):
+    assert parse_vars(data) == parse_split(data)
+
+@pytest.mark.parametrize('data,keys', [(GET_PARAMS, PARAMS_KEYS), (GET_STATUS, STATUS_KEYS)])
+def test_parse_vars_keys(data,keys):
+    old = parse_split(data)
+    assert parse_vars(data,keys) == { key: old[key] for key in keys }
+
+def test_parse_vars_skips_malformed():
+    # The old parser raised IndexError on these.
+    with pytest.raises(IndexError):
+        parse_split(MALFORMED)
+    good = "\n".join(line for line in MALFORMED.splitlines() if line.startswith('var ') and '=' in line)
+    assert parse_vars(MALFORMED) == parse_split(good)
+    assert parse_vars(MALFORMED) == {'id': '000C5DDC9D6C', 'sys_ver': '11.37.2.65', 'alarm_status': '1'}